@@ -0,0 +1,303 @@
+"""
+Offline load test: GuessTheSongBot, Game and MusicPlayer run against local stand-ins
+for Discord (guild, voice client, interaction, messages), Spotify and yt-dlp.
+
+    python -m benchmarks.load_benchmark --guilds 20 --players 10 --rate 0.5
+
+config.py must be importable (Spotify credentials can be dummy values, nothing is contacted).
+Reports on_message latency percentiles, event loop lag, board edits and the gap between rounds.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+import types
+import discord
+import src.extractor
+import src.playlist_cache
+import src.source
+from src.bot import GuessTheSongBot
+from src.game_components.game import GameState
+from src.sampler import sample_tracks
+from src.source import SpotifySource
+from src.stream_cache import StreamCache
+from .matcher_benchmark import CORPUS, CHATTER, typo
+
+ids = itertools.count(1)
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.on_message: list[float] = list()
+        self.loop_lag: list[float] = list()
+        self.round_gaps: list[float] = list()
+        self.edits = 0
+        self.deletes = 0
+        self.lookups = 0
+
+    @staticmethod
+    def percentiles(values: list[float]) -> str:
+        if not values:
+            return "-"
+        values = sorted(values)
+        return "  ".join(f"p{p}={values[min(len(values) - 1, len(values) * p // 100)] * 1000:.2f}ms"
+                         for p in (50, 90, 99, 100))
+
+    def report(self, elapsed: float) -> None:
+        print(f"elapsed: {elapsed:.1f}s")
+        print(f"on_message ({len(self.on_message)}): {self.percentiles(self.on_message)}")
+        print(f"event loop lag ({len(self.loop_lag)}): {self.percentiles(self.loop_lag)}")
+        print(f"gap between rounds ({len(self.round_gaps)}): {self.percentiles(self.round_gaps)}")
+        print(f"board edits: {self.edits} ({self.edits / elapsed:.1f}/s), deletes: {self.deletes}, "
+              f"yt-dlp lookups: {self.lookups}")
+
+
+stats = Stats()
+
+
+# -- Discord stand-ins --
+
+class FakeUser:
+    def __init__(self, name: str) -> None:
+        self.id = next(ids)
+        self.name = name
+
+    def __eq__(self, other: object) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild") -> None:
+        self.id = next(ids)
+        self.guild = guild
+        self.members: list[FakeUser] = list()
+
+    async def delete_messages(self, messages: list["FakeMessage"]) -> None:
+        await asyncio.sleep(args.discord_latency)
+        stats.deletes += len(messages)
+
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, author: FakeUser = None, content: str = "", embeds: list = None) -> None:
+        self.id = next(ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = embeds or []
+        self.created_at = discord.utils.utcnow()
+
+    async def delete(self) -> None:
+        await asyncio.sleep(args.discord_latency)
+        stats.deletes += 1
+
+    async def clear_reactions(self) -> None:
+        await asyncio.sleep(args.discord_latency)
+
+
+class FakeInteraction:
+    def __init__(self, channel: FakeChannel) -> None:
+        self.channel = channel
+        self.message = FakeMessage(channel, embeds=[discord.Embed(title="⚙️ Game Settings")])
+
+    async def edit_original_response(self, embed: discord.Embed = None, **kwargs) -> FakeMessage:
+        await asyncio.sleep(args.discord_latency)
+        stats.edits += 1
+        return FakeMessage(self.channel, embeds=[embed or self.message.embeds[0]])
+
+
+class FakeVoiceClient:
+    def __init__(self, channel: FakeChannel) -> None:
+        self.channel = channel
+        self._after = None
+        self._timer: asyncio.TimerHandle = None
+        self._ended_at: float = None
+
+    def play(self, source, after=None) -> None:
+        if self._ended_at is not None:
+            stats.round_gaps.append(time.perf_counter() - self._ended_at)
+        self._after = after
+        self._timer = asyncio.get_running_loop().call_later(args.song_seconds, self._finish)
+
+    def stop(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._finish()
+
+    def _finish(self) -> None:
+        self._timer = None
+        self._ended_at = time.perf_counter()
+        if self._after:
+            self._after(None)
+
+    async def disconnect(self) -> None:
+        self.stop()
+
+
+class FakeGuild:
+    def __init__(self) -> None:
+        self.id = next(ids)
+        self.channel = FakeChannel(self)
+        self.voice_client = FakeVoiceClient(self.channel)
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.user = FakeUser("bot")
+        self.loop = asyncio.get_running_loop()
+
+    def is_closed(self) -> bool:
+        return False
+
+    async def wait_until_ready(self) -> None:
+        return
+
+
+class FakeContext:
+    def __init__(self, bot: FakeBot, cog: GuessTheSongBot, guild: FakeGuild, author: FakeUser) -> None:
+        self.bot = bot
+        self.cog = cog
+        self.guild = guild
+        self.channel = guild.channel
+        self.author = author
+        self.voice_client = guild.voice_client
+
+
+class FakeAudio:
+    """Replaces discord.FFmpegOpusAudio, no FFmpeg process is started"""
+
+    def __init__(self, source: str, **kwargs) -> None:
+        self.source = source
+
+    def cleanup(self) -> None:
+        pass
+
+
+# -- Spotify and yt-dlp stand-ins --
+
+class FakeSpotify:
+    def __init__(self, tracks: int) -> None:
+        self.items = [{"track": {
+            "id": f"track{i}",
+            "name": title if i < len(CORPUS) else f"{title} {i}",
+            "artists": [{"name": a} for a in artists],
+            "album": {"images": [{"url": "https://example.com/cover.png"}], "name": "Album"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{i}"},
+            "duration_ms": int(args.song_seconds * 1000),
+            "external_ids": {"isrc": f"ISRC{i:08d}"},
+        }} for i, (title, artists) in zip(range(tracks), itertools.cycle(CORPUS))]
+
+    def _wait(self) -> None:
+        time.sleep(args.spotify_latency)
+
+    def playlist(self, playlist_id: str, fields: str = None) -> dict:
+        self._wait()
+        if fields:
+            return {"snapshot_id": "1"}
+        return {"name": playlist_id, "snapshot_id": "1", "tracks": {
+            "items": self.items[:100], "total": len(self.items), "limit": 100,
+            "next": "next" if len(self.items) > 100 else None}}
+
+    def playlist_items(self, playlist_id: str, limit: int, offset: int) -> dict:
+        self._wait()
+        return {"items": self.items[offset:offset + limit]}
+
+
+class FakeYoutubeDL:
+    def __init__(self, params: dict) -> None:
+        self.params = params
+
+    def extract_info(self, query: str, download: bool = False) -> dict:
+        time.sleep(args.lookup_latency)
+        stats.lookups += 1
+        expire = int(time.time()) + 6 * 3600
+        return {"entries": [{"id": query, "url": f"https://example.com/{query}?expire={expire}"}]}
+
+
+def install_fakes() -> None:
+    src.playlist_cache.SPOTIFY = FakeSpotify(args.tracks)
+    src.playlist_cache.playlist_cache.store = None  # keep the fake playlist out of the shared cache
+    src.extractor.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYoutubeDL)
+    src.source.stream_cache = StreamCache(path=":memory:")
+    discord.FFmpegOpusAudio = FakeAudio
+
+
+# -- Simulation --
+
+async def measure_loop_lag(interval: float = 0.05) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(time.perf_counter() - start - interval)
+
+
+async def player(cog: GuessTheSongBot, game, guild: FakeGuild, user: FakeUser) -> None:
+    while game.state != GameState.ENDED:
+        await asyncio.sleep(random.expovariate(args.rate))
+        if not game.started or not game.matcher:
+            continue
+
+        song = game.matcher.song
+        if random.random() < args.correct:
+            content = typo(random.choice([song.title, *song.artists]))
+        else:
+            content = random.choice(CHATTER)
+
+        message = FakeMessage(guild.channel, author=user, content=content)
+        start = time.perf_counter()
+        await cog.on_message(message)
+        stats.on_message.append(time.perf_counter() - start)
+
+
+async def run_guild(cog: GuessTheSongBot, bot: FakeBot) -> None:
+    guild = FakeGuild()
+    users = [FakeUser(f"player{i}") for i in range(args.players)]
+    guild.channel.members.extend(users)
+
+    ctx = FakeContext(bot, cog, guild, users[0])
+    game = cog._create_game(ctx, FakeInteraction(guild.channel), args.songs, "off")
+    for user in users:
+        game.add_player(user)
+
+    playlist = await src.playlist_cache.playlist_cache.fetch("load-test")
+    await src.playlist_cache.wait_for_songs([playlist], game.songs_number)
+    game.add_songs((SpotifySource(track) async for track in sample_tracks([playlist], game.songs_number)), [playlist.name])
+
+    await asyncio.gather(game.start(), *[player(cog, game, guild, user) for user in users])
+
+
+async def main() -> None:
+    install_fakes()
+    bot = FakeBot()
+    cog = GuessTheSongBot(bot)
+
+    lag = asyncio.create_task(measure_loop_lag())
+    start = time.perf_counter()
+    await asyncio.gather(*[run_guild(cog, bot) for _ in range(args.guilds)])
+    lag.cancel()
+
+    # let the last deletes and edits go out
+    await asyncio.sleep(2)
+    stats.report(time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--players", type=int, default=8, help="players per guild")
+    parser.add_argument("--rate", type=float, default=0.5, help="messages per second of each player")
+    parser.add_argument("--correct", type=float, default=0.05, help="share of guesses aimed at the answer")
+    parser.add_argument("--songs", type=int, default=5, help="songs per game")
+    parser.add_argument("--song-seconds", type=float, default=10)
+    parser.add_argument("--tracks", type=int, default=1000, help="tracks in the fake playlist")
+    parser.add_argument("--lookup-latency", type=float, default=0.5, help="seconds of each fake yt-dlp lookup")
+    parser.add_argument("--spotify-latency", type=float, default=0.1)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    random.seed(42)
+    asyncio.run(main())
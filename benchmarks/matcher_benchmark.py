@@ -0,0 +1,114 @@
+"""
+Benchmark of the answer matcher over a corpus of real song titles.
+
+    python -m benchmarks.matcher_benchmark [messages per song]
+"""
+import random
+import string
+import sys
+import time
+from src.catalog import catalog
+from src.source import SpotifySource
+from src.game_components.matcher import SongMatcher
+
+CORPUS = [
+    ("Blinding Lights", ["The Weeknd"]),
+    ("Shape of You", ["Ed Sheeran"]),
+    ("Dance Monkey", ["Tones And I"]),
+    ("Someone You Loved", ["Lewis Capaldi"]),
+    ("Sunflower - Spider-Man: Into the Spider-Verse", ["Post Malone", "Swae Lee"]),
+    ("One Dance", ["Drake", "Wizkid", "Kyla"]),
+    ("STAY (with Justin Bieber)", ["The Kid LAROI", "Justin Bieber"]),
+    ("Believer", ["Imagine Dragons"]),
+    ("Closer", ["The Chainsmokers", "Halsey"]),
+    ("Starboy", ["The Weeknd", "Daft Punk"]),
+    ("Heat Waves", ["Glass Animals"]),
+    ("Perfect", ["Ed Sheeran"]),
+    ("As It Was", ["Harry Styles"]),
+    ("Say You Won't Let Go", ["James Arthur"]),
+    ("Señorita", ["Shawn Mendes", "Camila Cabello"]),
+    ("bad guy", ["Billie Eilish"]),
+    ("Despacito - Remix", ["Luis Fonsi", "Daddy Yankee", "Justin Bieber"]),
+    ("Lovely (with Khalid)", ["Billie Eilish", "Khalid"]),
+    ("Rockstar (feat. 21 Savage)", ["Post Malone", "21 Savage"]),
+    ("Watermelon Sugar", ["Harry Styles"]),
+    ("Riptide", ["Vance Joy"]),
+    ("Bohemian Rhapsody - Remastered 2011", ["Queen"]),
+    ("Levitating (feat. DaBaby)", ["Dua Lipa", "DaBaby"]),
+    ("Don't Start Now", ["Dua Lipa"]),
+    ("Take Me To Church", ["Hozier"]),
+    ("Counting Stars", ["OneRepublic"]),
+    ("Circles", ["Post Malone"]),
+    ("Thinking out Loud", ["Ed Sheeran"]),
+    ("Another Love", ["Tom Odell"]),
+    ("Sweater Weather", ["The Neighbourhood"]),
+    ("Shallow", ["Lady Gaga", "Bradley Cooper"]),
+    ("Uptown Funk (feat. Bruno Mars)", ["Mark Ronson", "Bruno Mars"]),
+    ("Somebody That I Used To Know", ["Gotye", "Kimbra"]),
+    ("Mr. Brightside", ["The Killers"]),
+    ("Smells Like Teen Spirit", ["Nirvana"]),
+    ("Soldi", ["Mahmood"]),
+    ("Zitti e buoni", ["Måneskin"]),
+    ("Tutto molto interessante", ["Fabio Rovazzi"]),
+    ("Despacito", ["Luis Fonsi", "Daddy Yankee"]),
+    ("Tití Me Preguntó", ["Bad Bunny"]),
+    ("Me Porto Bonito", ["Bad Bunny", "Chencho Corleone"]),
+    ("Calm Down (with Selena Gomez)", ["Rema", "Selena Gomez"]),
+    ("Flowers", ["Miley Cyrus"]),
+    ("Kill Bill", ["SZA"]),
+    ("Anti-Hero", ["Taylor Swift"]),
+    ("Cruel Summer", ["Taylor Swift"]),
+    ("Creepin' (with The Weeknd & 21 Savage)", ["Metro Boomin", "The Weeknd", "21 Savage"]),
+    ("Unholy (feat. Kim Petras)", ["Sam Smith", "Kim Petras"]),
+    ("I Ain't Worried", ["OneRepublic"]),
+    ("Hey Jude - Remastered 2015", ["The Beatles"]),
+]
+
+CHATTER = ["lol", "no idea", "what is this", "again??", "i know this one",
+           "skip", "ahah", "the weekend maybe", "is it drake", "nope"]
+
+
+def typo(text: str) -> str:
+    if len(text) < 2:
+        return text
+    i = random.randrange(len(text))
+    edit = random.choice(["drop", "swap", "replace"])
+    if edit == "drop":
+        return text[:i] + text[i+1:]
+    if edit == "swap" and i < len(text) - 1:
+        return text[:i] + text[i+1] + text[i] + text[i+2:]
+    return text[:i] + random.choice(string.ascii_lowercase) + text[i+1:]
+
+
+def main(messages_per_song: int = 1000) -> None:
+    random.seed(42)
+    songs = [SpotifySource(catalog.intern(id_=str(i), title=title, artists=artists, image=None, duration_ms=0, link=None, isrc=None))
+             for i, (title, artists) in enumerate(CORPUS)]
+
+    start = time.perf_counter()
+    matchers = [SongMatcher(song) for song in songs]
+    setup = (time.perf_counter() - start) / len(matchers)
+
+    timings = list()
+    matched = 0
+    for matcher in matchers:
+        song = matcher.song
+        attempts = [typo(random.choice([song.title.split(" - ")[0], *song.artists])).lower()
+                    if random.random() < 0.3 else random.choice(CHATTER + [s.title for s in songs])
+                    for _ in range(messages_per_song)]
+        for attempt in attempts:
+            start = time.perf_counter()
+            title_guessed, artists = matcher.match(attempt)
+            timings.append(time.perf_counter() - start)
+            matched += title_guessed or bool(artists)
+
+    timings.sort()
+    print(f"songs: {len(songs)}, messages: {len(timings)}, matched: {matched}")
+    print(f"matcher setup: {setup * 1e6:.1f} us per song")
+    for p in (50, 90, 99, 100):
+        index = min(len(timings) - 1, len(timings) * p // 100)
+        print(f"p{p}: {timings[index] * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
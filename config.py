@@ -3,6 +3,9 @@ from spotipy import Spotify, SpotifyClientCredentials
 # -- Discord Config --
 BOT_TOKEN = ""
 SERVER = []
+# Sharded mode: WORKER_PROCESSES processes share SHARD_COUNT gateway shards (None = one per process)
+WORKER_PROCESSES = 1
+SHARD_COUNT = None
 
 # -- Spotify Config --
 SPOTIFY_CLIENT_ID = ""
@@ -15,12 +18,60 @@ SPOTIFY = Spotify(client_credentials_manager=client_credentials_manager)
 # -- GAME Config --
 TITLE_POINTS = 10
 ARTIST_POINTS = 10
+# Typos accepted in an answer: one every FUZZY_DISTANCE_RATIO characters, at most FUZZY_MAX_DISTANCE
+FUZZY_MAX_DISTANCE = 2
+FUZZY_DISTANCE_RATIO = 0.2
+# Discord writes are queued per guild by priority, each route within its budget: (requests, seconds)
+OUTBOUND_ROUTE_BUDGETS = {
+    "edit": (5, 5.0),
+    "delete": (5, 5.0),
+    "reaction": (1, 0.25),
+    "default": (5, 5.0),
+}
+OUTBOUND_MAX_INFLIGHT = 4
+# Seconds a low priority board update (thumbnail) may wait before being dropped
+LOW_PRIORITY_MAX_AGE = 10
+
+# Wrong guesses are deleted in bulk, at most this many seconds after being sent
+DELETE_BATCH_DELAY = 1.0
+# Clip mode: play only CLIP_LENGTH seconds of each song, starting from
+# "off" the beginning, whole song | "random" anywhere | "chorus" around the chorus | "fixed" CLIP_OFFSET
+CLIP_MODE = "off"
+CLIP_LENGTH = 30
+CLIP_OFFSET = 45
+# Min seconds between two scoreboard edits, the changes in between are merged
+BOARD_EDIT_INTERVAL = 1.5
 
 # -- Spotify Playlists --
 PLAYLISTS = {
     "🌍": "https://open.spotify.com/playlist/37i9dQZEVXbMDoHDwVN2tF?si=ab558af4e5be421d",
 }
 
+# Seconds between the snapshot checks of the cached playlists
+PLAYLIST_REFRESH_INTERVAL = 30 * 60
+# Playlists added from /play and not used for this many seconds are dropped from memory
+PLAYLIST_IDLE_TTL = 6 * 60 * 60
+# Max Spotify requests running at the same time while loading playlist pages
+PLAYLIST_FETCH_CONCURRENCY = 4
+# Complete playlists are saved here and shared by the worker processes, None keeps them only in memory
+PLAYLIST_CACHE_PATH = "playlist_cache.sqlite3"
+
+
+# -- Metrics --
+# Prometheus text endpoint on http://METRICS_HOST:METRICS_PORT/metrics, None disables it
+# (worker N of a sharded bot uses METRICS_PORT + N)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Event loop watchdog: stalls longer than LAG_THRESHOLD seconds are recorded with their stack
+LAG_MONITOR = True
+LAG_SAMPLE_INTERVAL = 0.1
+LAG_THRESHOLD = 0.1
+# Run on uvloop (pip install uvloop) instead of the asyncio event loop
+USE_UVLOOP = False
+# /profile: sampling interval in seconds and folder of the flamegraph dumps
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
 
 # -- Streaming Settings --
 
@@ -37,8 +88,33 @@ YTDL_OPTIONS = {
     "source_address": "0.0.0.0",
     "force-ipv4": True,
     "cachedir": False,
-    "postprocessor_args": [],
 }
 
+# yt-dlp lookups run on a thread pool so they never block the event loop
+EXTRACTOR_WORKERS = 4
+EXTRACTOR_TIMEOUT = 20  # seconds
+
+# How many upcoming songs get their stream url resolved while the current one plays
+PREFETCH_DEPTH = 3
+# Fallback lifetime (seconds) of a stream url that doesn't carry its own expire param
+STREAM_URL_TTL = 60 * 60
+# Stream urls expiring within this window (seconds) are resolved again
+STREAM_URL_REFRESH_MARGIN = 5 * 60
+
+# Resolved video ids and stream urls survive restarts in this SQLite file
+STREAM_CACHE_PATH = "stream_cache.sqlite3"
+STREAM_CACHE_SIZE = 10000  # max cached songs, least recently used are evicted first
+
+# FFmpeg outputs Opus packets sent as they are to the voice client,
+# volume and loudness normalization run as FFmpeg filters
+AUDIO_BITRATE = 128  # kbps
+AUDIO_FILTERS = "loudnorm=I=-16:LRA=11:TP=-1.5"  # "" to disable
+
+# Songs played at least AUDIO_CACHE_MIN_PLAYS times are kept encoded in AUDIO_CACHE_DIR
+# and played from disk, None disables the audio cache
+AUDIO_CACHE_DIR = None
+AUDIO_CACHE_SIZE = 2 * 1024 ** 3  # bytes
+AUDIO_CACHE_MIN_PLAYS = 2
+
 FFMPEG_OPTIONS = {"options": "-vn",
                   "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"}
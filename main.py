@@ -1,12 +1,47 @@
+import multiprocessing
 from src.bot import GuessTheSongBot
-from config import BOT_TOKEN
+from src.lag_monitor import install_uvloop
+from config import BOT_TOKEN, USE_UVLOOP, WORKER_PROCESSES, SHARD_COUNT
 import discord
 
-if __name__ == "__main__":
+
+def run_bot(shard_ids: list[int] = None, shard_count: int = None, worker: int = 0) -> None:
+    if USE_UVLOOP:
+        install_uvloop()
+
     intents = discord.Intents.default()
     intents.members = True
     intents.message_content = True
-    bot = discord.Bot(intents=intents)
 
-    bot.add_cog(GuessTheSongBot(bot))
+    if shard_count:
+        # every worker syncs the slash commands on connect to learn their ids (global or SERVER guilds):
+        # py-cord only writes the commands that differ, and the bulk overwrite is the same from every worker
+        bot = discord.AutoShardedBot(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+    else:
+        bot = discord.Bot(intents=intents)
+
+    bot.add_cog(GuessTheSongBot(bot, worker=worker))
     bot.run(BOT_TOKEN)
+
+
+def run_workers(workers: int, shard_count: int) -> None:
+    """One process per worker, each with its own shards and so its own guilds and games"""
+    # spawn: every process opens its own caches, thread pools and event loop
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_bot, name=f"shard-worker-{worker}",
+                        args=(list(range(worker, shard_count, workers)), shard_count, worker))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    if WORKER_PROCESSES > 1:
+        shard_count = SHARD_COUNT or WORKER_PROCESSES
+        run_workers(min(WORKER_PROCESSES, shard_count), shard_count)
+    else:
+        run_bot()
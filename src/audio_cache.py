@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .storage import Database, run_in_thread
+from config import AUDIO_CACHE_DIR, AUDIO_CACHE_SIZE, AUDIO_CACHE_MIN_PLAYS, AUDIO_BITRATE, AUDIO_FILTERS, FFMPEG_OPTIONS
+
+
+class AudioCache:
+    """
+    Songs played often are stored on disk already encoded (Opus, with AUDIO_FILTERS applied),
+    so they can be played without streaming them again.
+    Files are evicted least played first (then least recently used) to stay within `max_bytes`.
+    The index is shared with the other processes, so it's only queried from its own thread:
+    a write lock held elsewhere never blocks the event loop
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_SIZE, min_plays: int = AUDIO_CACHE_MIN_PLAYS) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.hits = 0
+        self.misses = 0
+        self.size = 0  # bytes stored, as seen at the last store
+        self.encoding = 0  # FFmpeg processes storing a song right now
+
+        self._queue: asyncio.Queue = None
+        self._queued: set[str] = set()
+        self._filler: asyncio.Task = None
+
+        if not self.enabled:
+            return
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="audio-cache")
+        self._db = Database(
+            os.path.join(directory, "index.sqlite3"),
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "key TEXT PRIMARY KEY, file TEXT, size INTEGER DEFAULT 0, "
+            "plays INTEGER DEFAULT 0, last_used REAL)")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self.directory, key.replace(":", "_").replace("/", "_").replace("|", "_") + ".ogg")
+
+    async def _run(self, method: callable, *args):
+        """Index and file operations run on the cache thread"""
+        return await run_in_thread(method, *args, executor=self._executor)
+
+    def _file(self, key: str) -> str:
+        row = self._db.execute(
+            "SELECT file FROM tracks WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    async def contains(self, key: str) -> bool:
+        if not self.enabled:
+            return False
+        return bool(await self._run(self._file, key))
+
+    async def get(self, key: str) -> str:
+        """Path of the cached audio, None on a miss"""
+        if not self.enabled:
+            return None
+
+        file = await self._run(self._file, key)
+        if file and await self._run(os.path.exists, file):
+            self.hits += 1
+            return file
+
+        self.misses += 1
+        return None
+
+    def _count_play(self, key: str) -> tuple[str, int]:
+        self._db.execute(
+            "INSERT INTO tracks (key, plays, last_used) VALUES (?, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET plays = plays + 1, last_used = excluded.last_used",
+            (key, time.time()))
+        self._db.commit()
+        return self._db.execute(
+            "SELECT file, plays FROM tracks WHERE key = ?", (key,)).fetchone()
+
+    async def record_play(self, key: str, stream_url: str = None) -> None:
+        """Count a play, a song played enough times is queued to be stored (needs a valid stream_url)"""
+        if not self.enabled:
+            return
+
+        file, plays = await self._run(self._count_play, key)
+
+        if stream_url and not file and plays >= self.min_plays and key not in self._queued:
+            if not self._queue:
+                self._queue = asyncio.Queue()
+                self._filler = asyncio.create_task(self._fill())
+            self._queued.add(key)
+            self._queue.put_nowait((key, stream_url))
+
+    async def _fill(self) -> None:
+        """Background worker that downloads and encodes the queued songs, one at a time"""
+        while True:
+            key, stream_url = await self._queue.get()
+            try:
+                await self._store(key, stream_url)
+            except Exception as e:
+                print(f"Errore salvando {key}: {e}")
+            finally:
+                self._queued.discard(key)
+
+    async def _store(self, key: str, stream_url: str) -> None:
+        path = self._file_path(key)
+        tmp_path = f"{path}.{os.getpid()}.part"  # other processes may be storing the same song
+
+        args = ["ffmpeg", *FFMPEG_OPTIONS["before_options"].split(), "-i", stream_url, "-vn"]
+        if AUDIO_FILTERS:
+            args += ["-af", AUDIO_FILTERS]
+        args += ["-c:a", "libopus", "-b:a", f"{AUDIO_BITRATE}k", "-ar", "48000", "-ac", "2",
+                 "-f", "ogg", "-loglevel", "error", "-y", tmp_path]
+
+        self.encoding += 1
+        try:
+            process = await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.DEVNULL)
+            returncode = await process.wait()
+        finally:
+            self.encoding -= 1
+        if returncode != 0:
+            await self._run(self._discard, tmp_path)
+            raise RuntimeError(f"ffmpeg exited with {process.returncode}")
+
+        await self._run(self._index, key, tmp_path, path)
+
+    @staticmethod
+    def _discard(path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _index(self, key: str, tmp_path: str, path: str) -> None:
+        os.replace(tmp_path, path)
+        self._db.execute("UPDATE tracks SET file = ?, size = ? WHERE key = ?",
+                         (path, os.path.getsize(path), key))
+        self._db.commit()
+        self._evict()
+
+    def _total_size(self) -> int:
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM tracks WHERE file IS NOT NULL").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self.size = self._total_size()
+        if total <= self.max_bytes:
+            return
+
+        for key, file, size in self._db.execute(
+                "SELECT key, file, size FROM tracks WHERE file IS NOT NULL ORDER BY plays, last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            self._db.execute(
+                "UPDATE tracks SET file = NULL, size = 0 WHERE key = ?", (key,))
+            total -= size
+        self._db.commit()
+        self.size = total
+
+    def stats(self) -> dict[str, int]:
+        """Counters only, the size is the one seen at the last store"""
+        return {"hits": self.hits, "misses": self.misses, "size": self.size}
+
+
+audio_cache = AudioCache()
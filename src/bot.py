@@ -1,22 +1,51 @@
 from typing import Union
+import io
+import os
 import discord
-from config import SERVER
-from .music_player import MusicPlayer
+from config import SERVER, PLAYLISTS, CLIP_MODE, LAG_MONITOR, METRICS_PORT
+from .music_player import MusicPlayer, CLIP_MODES
+from .playlist_cache import playlist_cache
+from .deleter import deleter
+from .outbound import close_scheduler
+from .extractor import extractor
+from .audio_cache import audio_cache
+from .lag_monitor import lag_monitor
+from .profiler import profiler
+from . import metrics, source
 from .view import SettingsView
 from .game_components.game import Game
-from .game_components.player import Player
 
 
 class GuessTheSongBot(discord.Cog):
 
-    def __init__(self, bot: discord.Bot) -> None:
+    def __init__(self, bot: discord.Bot, worker: int = 0) -> None:
         super().__init__()
         self.bot = bot
-        self.games = {}
+        self.worker = worker
+        self.games = {}  # only the guilds of this process shards
+        self._register_gauges()
 
     @discord.Cog.listener()
     async def on_ready(self) -> None:
         print(f'{self.bot.user.name} has connected to Discord!')
+        playlist_cache.keep_fresh(list(PLAYLISTS.values()))
+        await metrics.start_server(port=METRICS_PORT + self.worker if METRICS_PORT else None)
+        if LAG_MONITOR:
+            lag_monitor.start()
+
+    def _register_gauges(self) -> None:
+        """Metrics read only when scraped"""
+        metrics.ACTIVE_GAMES.callback = lambda: len(self.games)
+        metrics.FFMPEG_PROCESSES.callback = lambda: audio_cache.encoding + sum(
+            1 for game in self.games.values() if game.music_player.ffmpeg_running)
+        metrics.EXTRACTOR_PHASES.callback = lambda: {
+            (("phase", phase),): timing.total for phase, timing in list(extractor.timings.items())}
+        metrics.LOOP_STALLS.callback = lambda: {
+            (("site", o.site),): o.total for o in list(lag_monitor.offenders.values())}
+        metrics.CACHES.callback = lambda: {
+            (("cache", name), ("event", event)): value
+            for name, stats in (("stream", source.stream_cache.stats()), ("audio", audio_cache.stats()))
+            for event, value in stats.items()}
 
     def _get_game(self, guild: discord.Guild) -> Game:
         """Retrieve the guild game"""
@@ -25,13 +54,13 @@ class GuessTheSongBot(discord.Cog):
         except KeyError:
             return None
 
-    def _create_game(self, ctx: discord.ApplicationContext, board_interaction: discord.Interaction, songs_number: int) -> Game:
+    def _create_game(self, ctx: discord.ApplicationContext, board_interaction: discord.Interaction, songs_number: int, clip_mode: str) -> Game:
         game = self._get_game(ctx.guild)
         if not game:
             game = Game(
                 bot=self.bot,
                 ctx=ctx,
-                music_player=MusicPlayer(ctx, self.bot),
+                music_player=MusicPlayer(ctx, self.bot, clip_mode=clip_mode),
                 board_interaction=board_interaction,
                 songs_number=songs_number,
             )
@@ -48,12 +77,14 @@ class GuessTheSongBot(discord.Cog):
             game = self._get_game(before.channel.guild)
 
             if game and game.started:
-                game.remove_player(Player(member))
+                game.remove_player(member)
                 await game.refresh_embed()
 
     async def cleanup(self, ctx: discord.ApplicationContext):
         """Disconnect procedure and delete the game"""
         game = self._get_game(ctx.guild)
+        if game:
+            game.stop()
         try:
             await ctx.guild.voice_client.disconnect()
         except AttributeError:
@@ -63,6 +94,9 @@ class GuessTheSongBot(discord.Cog):
                 del self.games[ctx.guild.id]
         except KeyError:
             pass
+        # deletions still batching would open a new scheduler for the guild after it's closed
+        deleter.flush_guild(ctx.guild.id)
+        close_scheduler(ctx.guild.id)
 
     async def join_channel(self, ctx: discord.ApplicationContext, channel: discord.VoiceChannel = None) -> tuple[bool, str]:
         """ Join the VoiceChannel """
@@ -80,7 +114,8 @@ class GuessTheSongBot(discord.Cog):
         return True, ""
 
     @discord.slash_command(guild_ids=SERVER, name='play', description='Start playing!')
-    async def play(self, ctx: discord.ApplicationContext, songs_number: int) -> None:
+    async def play(self, ctx: discord.ApplicationContext, songs_number: int,
+                   clip_mode: discord.Option(str, "Play only an excerpt of each song", choices=CLIP_MODES, default=CLIP_MODE)) -> None:
         """
         Start a new game.
         Send the View message with game settings, then on confirm start the game
@@ -106,11 +141,15 @@ class GuessTheSongBot(discord.Cog):
             value=f"{songs_number}"
         )
 
-        settings_message = await ctx.respond(embed=embed, view=SettingsView(self, self.bot, ctx))
+        # cached playlists come back without any Spotify call
+        playlists = {emoji: await playlist_cache.fetch(link)
+                     for emoji, link in PLAYLISTS.items()}
+
+        settings_message = await ctx.respond(embed=embed, view=SettingsView(self, self.bot, ctx, playlists))
         msg = await settings_message.original_response()
         await msg.add_reaction("🙋‍♂️")
 
-        game = self._create_game(ctx, settings_message, songs_number)
+        game = self._create_game(ctx, settings_message, songs_number, clip_mode)
 
     @discord.Cog.listener()
     async def on_reaction_add(self, reaction: discord.Reaction, user: Union[discord.Member, discord.User]) -> None:
@@ -133,7 +172,7 @@ class GuessTheSongBot(discord.Cog):
         if user not in game.music_player.vc.channel.members:
             return
 
-        players = hanle_player(Player(user=user))
+        players = hanle_player(user)
         if game.started:
             await game.refresh_embed()
         else:
@@ -150,16 +189,15 @@ class GuessTheSongBot(discord.Cog):
 
         if not game or not game.started:
             return
-        player = Player(message.author)
-        if player not in game.players:
+        player = game.get_player(message.author.id)
+        if not player:
             return
 
-        # checking word with title and artists [to OPTIMIZE]
-        # title_answer = await game.check_title(player=player, title_attemp=message.content)
-        if not await game.check_title(player=player, message=message) and not await game.check_artist(player=player, message=message):
-            # artist_answer = await game.check_artist(player=player, artist_attemp=message.content)
-            # if not title_answer and not artist_answer:
-            await message.delete()
+        with metrics.ON_MESSAGE.time(guild=message.guild.id):
+            correct = await game.check_answer(player=player, message=message)
+            if not correct:
+                deleter.delete(message)
+        metrics.GUESSES.inc(result="correct" if correct else "wrong")
 
     @discord.slash_command(guild_ids=SERVER, name='end', description='End the game!')
     async def end(self, ctx: discord.ApplicationContext) -> None:
@@ -171,3 +209,36 @@ class GuessTheSongBot(discord.Cog):
 
         del self.games[ctx.guild.id]
         await ctx.respond("🛑 Game stopped!")
+
+    @discord.slash_command(guild_ids=SERVER, name='profile', description='Profile the bot for some seconds')
+    @discord.default_permissions(administrator=True)
+    async def profile(self, ctx: discord.ApplicationContext,
+                      seconds: discord.Option(int, "Length of the profile", min_value=1, max_value=600, default=30),
+                      top: discord.Option(int, "Entries in the summary", min_value=1, max_value=30, default=10)) -> None:
+        """Sample the running bot and send the top coroutines and functions with a flamegraph dump"""
+        if profiler.running:
+            await ctx.respond("A profile is already running, stop it with /profile_stop", ephemeral=True)
+            return
+
+        await ctx.respond(f"⏱️ Profiling for {seconds}s...", ephemeral=True)
+        profile = await profiler.run(seconds)
+        path = profile.save()
+
+        summary = profile.summary(top)[:1900]
+        files = [
+            discord.File(io.BytesIO(profile.folded().encode()),
+                         filename=os.path.basename(path)),
+            # event loop stalls seen by the watchdog since the start, with their stacks
+            discord.File(io.BytesIO(lag_monitor.report(top).encode()),
+                         filename="loop-stalls.txt"),
+        ]
+        await ctx.followup.send(f"```\n{summary}\n```", files=files, ephemeral=True)
+
+    @discord.slash_command(guild_ids=SERVER, name='profile_stop', description='Stop the running profile')
+    @discord.default_permissions(administrator=True)
+    async def profile_stop(self, ctx: discord.ApplicationContext) -> None:
+        if not profiler.running:
+            await ctx.respond("No profile is running", ephemeral=True)
+            return
+        profiler.stop()
+        await ctx.respond("Profile stopped", ephemeral=True)
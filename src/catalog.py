@@ -0,0 +1,67 @@
+import sys
+import weakref
+from .stream_cache import stream_cache
+
+
+class Track:
+    """Song metadata shared by every playlist and game, never modified after creation"""
+
+    __slots__ = ("id", "title", "artists", "image", "duration", "link", "isrc", "album", "__weakref__")
+
+    def __init__(self, id_: str, title: str, artists: tuple[str, ...], image: str, duration: float, link: str, isrc: str, album: str = None) -> None:
+        self.id = id_
+        self.title = title
+        self.artists = artists
+        self.image = image
+        self.duration = duration
+        self.link = link
+        self.isrc = isrc
+        self.album = album
+
+    def __repr__(self) -> str:
+        return f"{self.title} - {', '.join(self.artists)} [{self.album}]"
+
+    @property
+    def cache_key(self) -> str:
+        return stream_cache.key(self.isrc, self.title, self.artists)
+
+
+class TrackCatalog:
+    """
+    Process-wide interned tracks, deduplicated by Spotify id and ISRC.
+    Tracks are held weakly: once no playlist or game uses them they are dropped
+    """
+
+    def __init__(self) -> None:
+        self._by_id: weakref.WeakValueDictionary[str, Track] = weakref.WeakValueDictionary()
+        self._by_isrc: weakref.WeakValueDictionary[str, Track] = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def intern(self, id_: str, title: str, artists: list[str], image: str, duration_ms: int, link: str, isrc: str, album: str = None) -> Track:
+        track = self._by_id.get(id_)
+        if track is None and isrc:
+            # same recording released with another Spotify id (single, album, compilation...)
+            track = self._by_isrc.get(isrc)
+
+        if track is None:
+            track = Track(
+                id_=id_,
+                title=title,
+                artists=tuple(sys.intern(artist) for artist in artists),
+                image=image,
+                duration=duration_ms / 1000,
+                link=link,
+                isrc=isrc,
+                album=album,
+            )
+            if isrc:
+                self._by_isrc[isrc] = track
+
+        if id_:
+            self._by_id[id_] = track
+        return track
+
+
+catalog = TrackCatalog()
@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+import discord
+from .timers import timers
+from .outbound import OutboundScheduler, Priority, get_scheduler
+from config import DELETE_BATCH_DELAY
+
+BULK_DELETE_MAX = 100
+# the bulk delete endpoint refuses messages older than 14 days
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+
+
+class DeletionBatcher:
+    """
+    Messages to delete are collected per channel and removed with the bulk delete endpoint,
+    DELETE_BATCH_DELAY seconds after the first one or as soon as there are BULK_DELETE_MAX
+    """
+
+    def __init__(self, delay: float = DELETE_BATCH_DELAY) -> None:
+        self.delay = delay
+        self._pending: dict[int, list[discord.Message]] = dict()
+        self._tasks: set[asyncio.Task] = set()
+
+    def delete(self, message: discord.Message) -> None:
+        channel_id = message.channel.id
+        pending = self._pending.setdefault(channel_id, list())
+        pending.append(message)
+
+        if len(pending) >= BULK_DELETE_MAX:
+            timers.cancel_all((self, channel_id))
+            self._spawn(self.flush(channel_id))
+        elif len(pending) == 1:
+            timers.call_later((self, channel_id), self.delay,
+                              self.flush, channel_id)
+
+    def flush_guild(self, guild_id: int) -> None:
+        """Send now the guild deletions still waiting, on its scheduler before it gets closed"""
+        channels = [channel_id for channel_id, messages in self._pending.items()
+                    if messages and messages[0].channel.guild.id == guild_id]
+        if not channels:
+            return
+
+        outbound = get_scheduler(guild_id)
+        for channel_id in channels:
+            timers.cancel_all((self, channel_id))
+            self._spawn(self.flush(channel_id, outbound))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, channel_id: int, outbound: OutboundScheduler = None) -> None:
+        messages = self._pending.pop(channel_id, [])
+        if not messages:
+            return
+
+        channel = messages[0].channel
+        outbound = outbound or get_scheduler(channel.guild.id)
+
+        limit = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        bulk = [m for m in messages if m.created_at > limit]
+        single = [m for m in messages if m.created_at <= limit]
+
+        if len(bulk) >= 2:
+            try:
+                await outbound.submit("delete", channel.delete_messages, priority=Priority.LOW, messages=bulk)
+            except (AttributeError, discord.HTTPException):
+                single += bulk
+        else:
+            single += bulk
+
+        results = await asyncio.gather(
+            *[outbound.submit("delete", message.delete, priority=Priority.LOW) for message in single],
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, discord.NotFound):
+                print(f"Errore eliminando un messaggio: {result}")
+
+
+deleter = DeletionBatcher()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+import yt_dlp
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from config import YTDL_OPTIONS, EXTRACTOR_WORKERS, EXTRACTOR_TIMEOUT
+
+if TYPE_CHECKING:
+    from .source import SpotifySource
+
+
+@dataclass
+class PhaseTiming:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Extractor:
+    """
+    Runs the yt-dlp lookups on a bounded thread pool shared by every guild.
+    YoutubeDL isn't thread safe, so each worker thread keeps its own warm instance
+    """
+
+    def __init__(self, workers: int = EXTRACTOR_WORKERS, timeout: float = EXTRACTOR_TIMEOUT) -> None:
+        self.timeout = timeout
+        self.timings: dict[str, PhaseTiming] = dict()
+        self._timings_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="extractor")
+        self._slots = asyncio.Semaphore(workers)
+
+    @contextmanager
+    def timed(self, phase: str):
+        """Record how long the block takes under `phase`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._timings_lock:
+                timing = self.timings.setdefault(phase, PhaseTiming())
+                timing.count += 1
+                timing.total += elapsed
+                timing.max = max(timing.max, elapsed)
+
+    def _get_ydl(self) -> yt_dlp.YoutubeDL:
+        ydl = getattr(self._local, "ydl", None)
+        if not ydl:
+            with self.timed("setup"):
+                ydl = yt_dlp.YoutubeDL(dict(YTDL_OPTIONS))
+            self._local.ydl = ydl
+        return ydl
+
+    def extract_info(self, query: str, **params) -> dict:
+        """
+        Blocking lookup with this thread's YoutubeDL,
+        `params` override the yt-dlp options only for this call
+        """
+        ydl = self._get_ydl()
+        previous = {key: ydl.params.get(key) for key in params}
+        ydl.params.update(params)
+        try:
+            with self.timed("extract"):
+                return ydl.extract_info(query, download=False)
+        finally:
+            ydl.params.update(previous)
+
+    async def get_stream(self, song: SpotifySource) -> str:
+        """
+        Resolve the song stream url without blocking the event loop.
+        Raises asyncio.TimeoutError if the lookup takes more than `timeout` seconds
+        """
+        loop = asyncio.get_running_loop()
+
+        # the slot is held until the worker thread is really done, so lookups that
+        # timed out or got cancelled while running still count against the cap
+        with self.timed("queue"):
+            await self._slots.acquire()
+        try:
+            future = self._executor.submit(song.get_stream)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._release(loop))
+
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+
+    def _release(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Called from the worker thread, the loop may be closed if the bot is shutting down"""
+        if loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._slots.release)
+        except RuntimeError:
+            pass  # closed in the meantime
+
+
+extractor = Extractor()
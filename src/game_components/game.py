@@ -1,9 +1,16 @@
+import asyncio
+import time
+from typing import AsyncIterator
 import discord
 from ..music_player import MusicPlayer
 from ..source import SpotifySource
 from .player import Player
-from ..utils import get_field, compare_words
-from config import TITLE_POINTS, ARTIST_POINTS
+from .leaderboard import Leaderboard
+from .matcher import SongMatcher
+from ..utils import get_field, fields_index
+from ..outbound import Priority, get_scheduler
+from ..metrics import BOARD_EDIT
+from config import TITLE_POINTS, ARTIST_POINTS, BOARD_EDIT_INTERVAL, LOW_PRIORITY_MAX_AGE
 from enum import Enum
 
 
@@ -20,86 +27,150 @@ class Game:
         self.music_player = music_player
         self.board_message = board_interaction
         self.songs_number = songs_number
-        self.creator = Player(self._ctx.author)
-        self.players = set()
-        self.add_player(self.creator)
+        self.players: dict[int, Player] = dict()  # user id -> Player
+        self.leaderboard = Leaderboard()
+        self.add_player(self._ctx.author)
+        self.creator = self.players[self._ctx.author.id]
         self.state: GameState = GameState.NOT_STARTED
         self.music_player.game = self
 
-        self.songs: list[SpotifySource] = list()
         self.playlists_names: list[str] = list()
+        self._adding: asyncio.Task = None
         self._skip_song_votes = set()
         self._last_round_points = dict()
+        self.matcher: SongMatcher = None
+
+        self.outbound = get_scheduler(self._ctx.guild.id)
+        self._pending_edit = dict()
+        self._pending_priority = Priority.LOW
+        self._sent_embed: discord.Embed = None
+        self._flush_task: asyncio.Task = None
+        self._last_edit = 0.0
+        self._board_fields: dict[str, int] = dict()  # board field name -> index
 
     @property
     def started(self) -> bool:
         return self.state == GameState.STARTED
 
-    def add_player(self, player: Player) -> set[Player]:
-        self.players.add(player)
-        return self.players
+    def add_player(self, user: discord.User) -> list[Player]:
+        if user.id not in self.players:
+            player = Player(user)
+            self.players[user.id] = player
+            self.leaderboard.add(player)
+        return list(self.players.values())
 
-    def remove_player(self, player: Player) -> set[Player]:
-        if player in self.players and player != self.creator:
-            self.players.remove(player)
-        return self.players
+    def remove_player(self, user: discord.User) -> list[Player]:
+        if user.id != self.creator.user.id:
+            player = self.players.pop(user.id, None)
+            if player:
+                self.leaderboard.remove(player)
+        return list(self.players.values())
 
     def clear_votes(self) -> None:
         self._skip_song_votes = set()
 
-    def get_player(self, player: Player) -> Player:
-        for p in self.players:
-            if player == p:
-                return p
-        return
+    def start_round(self, song: SpotifySource) -> None:
+        self.matcher = SongMatcher(song)
+
+    def end_round(self) -> None:
+        self.matcher = None
+
+    def get_player(self, user_id: int) -> Player:
+        return self.players.get(user_id)
+
+    @property
+    def current_embed(self) -> discord.Embed:
+        """Board embed including the edits not sent yet"""
+        return self._pending_edit.get("embed") or self._sent_embed or self.board_message.message.embeds[0]
 
     async def refresh_embed(self) -> None:
-        message = self.board_message.message
-        if message:
-            embed = self.get_embed(embed=message.embeds[0])
+        if self.board_message.message:
+            embed = self.get_embed(embed=self.current_embed)
             await self.edit_message(embed=embed)
 
-    async def add_songs(self, songs: list[SpotifySource], playlists_names: list[str]) -> None:
-        self.songs = songs
+    def add_songs(self, songs: AsyncIterator[SpotifySource], playlists_names: list[str]) -> None:
+        """Queue the songs in background, each one is taken from `songs` when the queue has room"""
         self.playlists_names = playlists_names
+        self._adding = asyncio.create_task(self._add_songs(songs))
 
-        for i, song in enumerate(songs):
-            await self.music_player.add_to_queue(i+1, song)
+    async def _add_songs(self, songs: AsyncIterator[SpotifySource]) -> None:
+        i = 0
+        async for song in songs:
+            i += 1
+            await self.music_player.add_to_queue(i, song)
         await self.music_player.add_to_queue(0, None)
 
+    def stop(self) -> None:
+        self.music_player.stop()
+        if self._adding:
+            self._adding.cancel()
+
     async def start(self) -> None:
         # start the game
         self.state = GameState.STARTED
         # 0. start the music
         await self.music_player.player_loop()
 
-    async def edit_message(self, **kwargs) -> None:
-        self.board_message.message = await self.board_message.edit_original_response(**kwargs)
+    async def edit_message(self, flush: bool = False, priority: Priority = Priority.NORMAL, **kwargs) -> None:
+        """
+        Board edits are merged and sent at most once every BOARD_EDIT_INTERVAL seconds,
+        `flush` sends them right away with high priority
+        """
+        self._pending_edit.update(kwargs)
+        self._pending_priority = min(
+            self._pending_priority, Priority.HIGH if flush else priority)
+
+        if flush:
+            if self._flush_task:
+                self._flush_task.cancel()
+                self._flush_task = None
+            await self.flush_message()
+        elif not self._flush_task:
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(max(0, self._last_edit + BOARD_EDIT_INTERVAL - time.monotonic()))
+        self._flush_task = None
+        await self.flush_message()
+
+    async def flush_message(self) -> None:
+        kwargs, self._pending_edit = self._pending_edit, dict()
+        priority, self._pending_priority = self._pending_priority, Priority.LOW
+        if not kwargs:
+            return
+
+        self._last_edit = time.monotonic()
+        if "embed" in kwargs:
+            self._sent_embed = kwargs["embed"]
+
+        # a board edit still queued is superseded by this one, merging their changes
+        with BOARD_EDIT.time(guild=self._ctx.guild.id):
+            message = await self.outbound.submit(
+                "edit", self.board_message.edit_original_response, priority=priority, key="board",
+                max_age=LOW_PRIORITY_MAX_AGE if priority == Priority.LOW else None, **kwargs)
+        if message:
+            self.board_message.message = message
 
     def get_embed(self, embed: discord.Embed = None, **kwargs):
         if not embed:
-            # print(len(self.songs), self.songs)
-            index, song = self.music_player.playing_song
             embed = discord.Embed(
                 color=discord.Color.green(),
-                title=f"Guess the song #{index}",
+                title=f"Guess the song #{self.music_player.round}",
                 description=f"Songs from {', '.join(self.playlists_names)}\nSend messages with the name of the song!"
             )
             embed.add_field(name="Title", value="???")
             embed.add_field(name="Artists", value="???")
             embed.add_field(name='\u200B', value='\u200B')
 
-            embed.add_field(name="Players", value="\n".join(
-                [str(p) for p in sorted(self.players, key=lambda p: p.points, reverse=True)]))
-            embed.add_field(name="Points", value="\n".join(
-                [str(p.points) for p in sorted(self.players, key=lambda p: p.points, reverse=True)]))
+            players_text, points_text = self.leaderboard.text
+            embed.add_field(name="Players", value=players_text)
+            embed.add_field(name="Points", value=points_text)
 
             embed.add_field(name="Skips", value="\n".join(
                 [str(p) for p in self._skip_song_votes]) if self._skip_song_votes else f"0/{len(self.players)}")
 
-            last_song_index = index-2
-            if last_song_index >= 0:
-                last_song = self.songs[last_song_index]
+            last_song = self.music_player.previous_song
+            if last_song:
                 last_song_text = (
                     f"🎵 Title: **{last_song.title}**\n"
                     f"✏️ Artists: **{', '.join(last_song.artists)}**\n\n"
@@ -116,78 +187,87 @@ class Game:
                 embed.add_field(name="About the last song",
                                 value=last_song_text, inline=False)
 
+            self._board_fields = fields_index(embed.fields)
+
         else:
             for name, value in kwargs.items():
-                pos, field = get_field(embed.fields, name)
+                pos, field = self._get_board_field(embed, name)
 
                 embed.set_field_at(pos, name=field.name,
                                    value=f"**{value}**", inline=field.inline)
 
             # Updates points & skips
-            pos, field = get_field(embed.fields, "Players")
+            players_text, points_text = self.leaderboard.text
+            pos, field = self._get_board_field(embed, "Players")
             if field:
-                embed.set_field_at(index=pos, name="Players", value="\n".join(
-                    [str(p) for p in sorted(self.players, key=lambda p: p.points, reverse=True)]))
+                embed.set_field_at(index=pos, name="Players", value=players_text)
 
-            pos, field = get_field(embed.fields, "Points")
+            pos, field = self._get_board_field(embed, "Points")
             if field:
-                embed.set_field_at(index=pos, name="Points", value="\n".join(
-                    [str(p.points) for p in sorted(self.players, key=lambda p: p.points, reverse=True)]), inline=field.inline)
+                embed.set_field_at(index=pos, name="Points",
+                                   value=points_text, inline=field.inline)
 
-            pos, field = get_field(embed.fields, "Skips")
+            pos, field = self._get_board_field(embed, "Skips")
             if field:
                 embed.set_field_at(index=pos, name="Skips", value=", ".join(
                     [str(p) for p in self._skip_song_votes]) if self._skip_song_votes else f"0/{len(self.players)}", inline=field.inline)
 
         return embed
 
-    async def check_title(self, player: Player, message: discord.Message) -> bool:
-        title_attemp = message.content
-        song = self.music_player.playing_song[1]
-        if not compare_words(title_attemp, song.title):
+    def _get_board_field(self, embed: discord.Embed, key: str) -> tuple[int, discord.EmbedField]:
+        """Field lookup through the index built with the board, linear search if the layout doesn't match"""
+        pos = self._board_fields.get(key.lower())
+        if pos is not None and pos < len(embed.fields) and embed.fields[pos].name.lower() == key.lower():
+            return pos, embed.fields[pos]
+        return get_field(embed.fields, key)
+
+    async def check_answer(self, player: Player, message: discord.Message) -> bool:
+        """Check the message against the title and all the artists at once"""
+        if not self.matcher or self.matcher.song.title_guessed:
+            # the round is over, the next song is on its way
             return False
 
-        player = self.get_player(player)
-        player.points += TITLE_POINTS
+        title_guessed, artists = self.matcher.match(message.content)
+        if title_guessed:
+            await self.guess_title(player=player, message=message)
+            return True
+        if artists:
+            return await self.guess_artist(player=player, message=message, artists=artists)
+        return False
+
+    async def guess_title(self, player: Player, message: discord.Message) -> None:
+        title_attemp = message.content
+        song = self.matcher.song
+
+        self.leaderboard.add_points(player, TITLE_POINTS)
+        song.title_guessed = True
         song.guessed_metadata.update(
             {"title": (player, title_attemp, TITLE_POINTS)})
 
         song.messages.append(message)
 
-        message = self.board_message.message
-        embed = self.get_embed(embed=message.embeds[0], title=song.title)
+        embed = self.get_embed(embed=self.current_embed, title=song.title)
 
-        await self.edit_message(embed=embed)
+        # the title must be on the board before the next song starts
+        await self.edit_message(embed=embed, flush=True)
 
         await self.music_player.skip()
-        return True
 
-    async def check_artist(self, player: Player, message: discord.Message) -> bool:
+    async def guess_artist(self, player: Player, message: discord.Message, artists: list[int]) -> bool:
         artist_attemp = message.content
-        song = self.music_player.playing_song[1]
-        embed_message = self.board_message.message
-        old_embed = embed_message.embeds[0]
-        _, field = get_field(old_embed.fields, "Artists")
+        song = self.matcher.song
 
         artist = None
-        for a in song.artists:
-            if compare_words(artist_attemp, a) and a.lower() not in field.value.lower():
-                artist = a
+        for i in artists:
+            if not song.is_artist_guessed(i):
+                artist = i
 
-        if not artist:
+        if artist is None:
             return False
 
-        complete = all([a.lower() in field.value.lower()
-                       or a.lower() == artist.lower() for a in song.artists])
-
-        artists = ", ".join(
-            [a for a in song.artists if a in field.value or a == artist])
+        song.guess_artist(artist)
 
-        if not complete:
-            artists += ", ???"
-
-        player = self.get_player(player)
-        player.points += ARTIST_POINTS // len(song.artists)
+        self.leaderboard.add_points(player, ARTIST_POINTS // len(song.artists))
 
         if player.user.id not in song.guessed_metadata["artists"]:
             song.guessed_metadata["artists"][player.user.id] = {
@@ -200,13 +280,15 @@ class Game:
 
         song.messages.append(message)
 
-        embed = self.get_embed(embed=embed_message.embeds[0], artists=artists)
+        embed = self.get_embed(embed=self.current_embed, artists=song.artists_text)
 
         await self.edit_message(embed=embed)
         return True
 
     async def skip_song(self, user: discord.User) -> list[Player]:
-        player = self.get_player(Player(user=user))
+        player = self.get_player(user.id)
+        if not player:
+            return self._skip_song_votes
 
         if player in self._skip_song_votes:
             self._skip_song_votes.remove(player)
@@ -219,17 +301,15 @@ class Game:
         return self._skip_song_votes
 
     async def insert_image(self, song: SpotifySource) -> None:
-        message = self.board_message.message
-        embed = message.embeds[0]
+        embed = self.current_embed
         embed.set_thumbnail(url=song.image)
 
-        await self.edit_message(embed=embed)
+        await self.edit_message(embed=embed, priority=Priority.LOW)
 
     async def end(self) -> None:
         self.state = GameState.ENDED
 
-        players_leaderboard = sorted(
-            self.players, key=lambda p: p.points, reverse=True)
+        players_leaderboard = list(self.leaderboard)
 
         embed = discord.Embed(
             color=discord.Color.yellow(),
@@ -247,5 +327,5 @@ class Game:
             embed.add_field(name="Points", value="\n".join(
                 [str(p.points) for p in players_leaderboard[1:]]), inline=True)
 
-        await self.board_message.message.clear_reactions()
-        await self.edit_message(embed=embed, view=None)
+        await self.outbound.submit("reaction", self.board_message.message.clear_reactions)
+        await self.edit_message(embed=embed, view=None, flush=True)
@@ -0,0 +1,55 @@
+import bisect
+import itertools
+from .player import Player
+
+
+class Leaderboard:
+    """Players kept sorted by points (ties by join order), updated with a binary search on every change"""
+
+    def __init__(self) -> None:
+        self._ranking: list[tuple[int, int, Player]] = list()  # (-points, join order, player)
+        self._entries: dict[Player, tuple[int, int, Player]] = dict()
+        self._join_order = itertools.count()
+        self._text: tuple[str, str] = None
+
+    def __iter__(self):
+        return (player for *_, player in self._ranking)
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def __getitem__(self, index: int) -> Player:
+        return self._ranking[index][-1]
+
+    def _insert(self, player: Player, join_order: int) -> None:
+        entry = (-player.points, join_order, player)
+        bisect.insort(self._ranking, entry)
+        self._entries[player] = entry
+        self._text = None
+
+    def _pop(self, player: Player) -> tuple[int, int, Player]:
+        entry = self._entries.pop(player)
+        del self._ranking[bisect.bisect_left(self._ranking, entry)]
+        self._text = None
+        return entry
+
+    def add(self, player: Player) -> None:
+        if player not in self._entries:
+            self._insert(player, next(self._join_order))
+
+    def remove(self, player: Player) -> None:
+        if player in self._entries:
+            self._pop(player)
+
+    def add_points(self, player: Player, points: int) -> None:
+        _, join_order, player = self._pop(player)
+        player.points += points
+        self._insert(player, join_order)
+
+    @property
+    def text(self) -> tuple[str, str]:
+        """Players and Points fields values, rendered again only after a change"""
+        if self._text is None:
+            self._text = ("\n".join(str(p) for p in self),
+                          "\n".join(str(p.points) for p in self))
+        return self._text
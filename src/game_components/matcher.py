@@ -0,0 +1,101 @@
+from __future__ import annotations
+from collections import Counter
+from typing import TYPE_CHECKING
+from ..utils import normalize
+from config import FUZZY_MAX_DISTANCE, FUZZY_DISTANCE_RATIO
+
+if TYPE_CHECKING:
+    from ..source import SpotifySource
+
+GRAM_SIZE = 3
+
+
+def grams(text: str) -> Counter:
+    return Counter(text[i:i+GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1))
+
+
+def bounded_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance of a and b, or max_distance + 1 as soon as it's clearly greater"""
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+    if len(a) > len(b):
+        a, b = b, a
+
+    # only the diagonal band |i - j| <= max_distance can stay under the bound
+    previous = [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= max_distance:
+            current[0] = i
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        for j in range(low, high + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]), too_far)
+        if min(current[low - 1:high + 1]) > max_distance:
+            return too_far
+        previous = current
+
+    return previous[len(b)]
+
+
+class Target:
+    __slots__ = ("text", "artist", "max_distance", "grams", "min_shared_grams")
+
+    def __init__(self, text: str, artist: int, max_distance: int) -> None:
+        self.text = text
+        self.artist = artist    # index in song.artists, None for the title
+        self.max_distance = max_distance
+        self.grams = grams(text)
+        # q-gram lemma: within k edits at least len - q + 1 - k*q grams are shared
+        self.min_shared_grams = len(text) - GRAM_SIZE + 1 - max_distance * GRAM_SIZE
+
+
+class SongMatcher:
+    """
+    Song title and artists normalized and indexed once per round.
+    Each message is normalized once: exact answers are a dict lookup, near misses
+    (within a few typos) are filtered with a trigram index before computing the edit distance
+    """
+
+    def __init__(self, song: SpotifySource, max_distance: int = FUZZY_MAX_DISTANCE, distance_ratio: float = FUZZY_DISTANCE_RATIO) -> None:
+        self.song = song
+        self.targets: list[Target] = list()
+        self._exact: dict[str, list[Target]] = dict()
+        self._index: dict[str, list[Target]] = dict()
+        self._unindexed: list[Target] = list()  # too short for the trigram filter
+
+        for text, artist in [(normalize(song.title), None), *[(normalize(a), i) for i, a in enumerate(song.artists)]]:
+            target = Target(text, artist, min(
+                max_distance, int(len(text) * distance_ratio)))
+            self.targets.append(target)
+            self._exact.setdefault(text, []).append(target)
+
+            if target.max_distance == 0:
+                continue
+            if target.min_shared_grams <= 0:
+                self._unindexed.append(target)
+            else:
+                for gram in target.grams:
+                    self._index.setdefault(gram, []).append(target)
+
+    def _matching_targets(self, attempt: str) -> list[Target]:
+        exact = self._exact.get(attempt)
+        if exact:
+            return exact
+
+        shared: dict[Target, int] = dict()
+        for gram, count in grams(attempt).items():
+            for target in self._index.get(gram, ()):
+                shared[target] = shared.get(
+                    target, 0) + min(count, target.grams[gram])
+
+        candidates = [target for target, count in shared.items()
+                      if count >= target.min_shared_grams]
+        return [target for target in [*candidates, *self._unindexed]
+                if bounded_distance(attempt, target.text, target.max_distance) <= target.max_distance]
+
+    def match(self, attempt: str) -> tuple[bool, list[int]]:
+        """return title_guessed, indexes in song.artists of the guessed artists"""
+        targets = self._matching_targets(normalize(attempt))
+        return any(t.artist is None for t in targets), [t.artist for t in targets if t.artist is not None]
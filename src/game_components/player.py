@@ -2,15 +2,17 @@ import discord
 
 
 class Player:
+    __slots__ = ("user", "points")
+
     def __init__(self, user: discord.User) -> None:
         self.user = user
         self.points = 0
 
     def __eq__(self, __o: object) -> bool:
-        return isinstance(__o, Player) and self.user == __o.user
+        return isinstance(__o, Player) and self.user.id == __o.user.id
 
     def __hash__(self) -> int:
-        return hash(self.user)
+        return hash(self.user.id)
 
     def __str__(self) -> str:
         return f"<@{self.user.id}>"
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from .metrics import LOOP_LAG
+from config import LAG_SAMPLE_INTERVAL, LAG_THRESHOLD
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Offender:
+    site: str
+    stalls: int = 0
+    total: float = 0.0   # seconds the loop was blocked
+    stack: list[traceback.FrameSummary] = field(default_factory=list)
+
+
+class LagMonitor:
+    """
+    A coroutine beats every `interval` seconds on the event loop while a watchdog thread
+    checks it: when a beat is more than `threshold` seconds late the loop is blocked, so the
+    watchdog takes the stack of the loop thread, which is the callback or coroutine step running.
+    Stalls are grouped by call site: the innermost frame of the bot's own code
+    """
+
+    def __init__(self, interval: float = LAG_SAMPLE_INTERVAL, threshold: float = LAG_THRESHOLD) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.offenders: dict[str, Offender] = dict()
+        self._lock = threading.Lock()
+        self._heartbeat = time.monotonic()
+        self._stalled_site: str = None
+        self._loop_thread_id: int = None
+        self._beater: asyncio.Task = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._beater and not self._beater.done())
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._beater = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name="lag-monitor",
+                         daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._beater:
+            self._beater.cancel()
+
+    async def _beat(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self._heartbeat = now
+            LOOP_LAG.observe(lag)
+
+            with self._lock:
+                if self._stalled_site:
+                    self.offenders[self._stalled_site].total += lag
+                    self._stalled_site = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold or self._stalled_site:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            site = self._call_site(stack)
+
+            with self._lock:
+                offender = self.offenders.setdefault(site, Offender(site))
+                offender.stalls += 1
+                offender.stack = stack
+                self._stalled_site = site
+            print(f"Event loop bloccato da {stalled:.2f}s in {site}")
+
+    @staticmethod
+    def _is_bot_code(filename: str) -> bool:
+        # a virtualenv inside the project folder holds library code
+        return (filename.startswith(PROJECT_DIR) and not filename.endswith("lag_monitor.py")
+                and "site-packages" not in filename and "dist-packages" not in filename)
+
+    @classmethod
+    def _call_site(cls, stack: list[traceback.FrameSummary]) -> str:
+        for frame in reversed(stack):
+            if cls._is_bot_code(frame.filename):
+                return f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} {frame.name}"
+        frame = stack[-1]
+        return f"{frame.filename}:{frame.lineno} {frame.name}"
+
+    def report(self, top: int = 10) -> str:
+        """Worst call sites by total blocked time, with the stack of the last stall"""
+        with self._lock:
+            offenders = sorted(self.offenders.values(),
+                               key=lambda o: o.total, reverse=True)[:top]
+        if not offenders:
+            return "No event loop stalls recorded"
+
+        lines = list()
+        for o in offenders:
+            lines.append(f"{o.total:.2f}s in {o.stalls} stalls - {o.site}")
+            lines.extend("    " + line.rstrip()
+                         for line in traceback.format_list(o.stack[-5:]))
+        return "\n".join(lines)
+
+
+lag_monitor = LagMonitor()
+
+
+def install_uvloop() -> bool:
+    """Use uvloop for the event loop if it's installed"""
+    try:
+        import uvloop
+    except ImportError:
+        print("uvloop non installato, uso il loop di asyncio")
+        return False
+
+    uvloop.install()
+    return True
@@ -0,0 +1,166 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable
+from aiohttp import web
+from config import METRICS_HOST, METRICS_PORT
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+LabelsKey = tuple[tuple[str, str], ...]
+
+
+def _labels_key(labels: dict) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelsKey, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        registry.append(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.description}",
+                          f"# TYPE {self.name} {self.kind}",
+                          *self.samples()])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self._values: dict[LabelsKey, float] = dict()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """Value read only when scraped: `callback` returns a number or a dict labels -> number"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, callback: Callable[[], object]) -> None:
+        super().__init__(name, description)
+        self.callback = callback
+
+    def samples(self) -> list[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            return [f"{self.name} {values}"]
+        return [f"{self.name}{_format_labels(_labels_key(labels))} {value}"
+                for labels, value in ((dict(k), v) for k, v in values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description)
+        self.buckets = buckets
+        self._values: dict[LabelsKey, list] = dict()  # [bucket counts..., +Inf count, sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels_key(labels)
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self.buckets) + 3)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = list()
+        for key, values in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+            lines.append(
+                f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {values[-1]}")
+        return lines
+
+
+registry: list[Metric] = list()
+
+
+def render() -> str:
+    """Prometheus text format, everything is computed here, on scrape"""
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+_runner: web.AppRunner = None
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+    """Serve /metrics, does nothing if already started or METRICS_PORT is None"""
+    global _runner
+    if _runner or port is None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+
+# -- Bot metrics --
+
+STREAM_RESOLVE = Histogram(
+    "sarabanbot_stream_resolve_seconds", "Time to resolve a song stream url (cache or yt-dlp)")
+STREAM_RESOLVE_ERRORS = Counter(
+    "sarabanbot_stream_resolve_errors_total", "Songs dropped because their stream could not be resolved")
+FIRST_AUDIO = Histogram(
+    "sarabanbot_time_to_first_audio_seconds", "Time from the start of a round to the audio playing")
+BOARD_EDIT = Histogram(
+    "sarabanbot_board_edit_seconds", "Latency of the scoreboard edits")
+ON_MESSAGE = Histogram(
+    "sarabanbot_on_message_seconds", "Time spent handling a player message")
+GUESSES = Counter(
+    "sarabanbot_guesses_total", "Messages sent by players, by result")
+ACTIVE_GAMES = Gauge(
+    "sarabanbot_active_games", "Games running", lambda: 0)
+FFMPEG_PROCESSES = Gauge(
+    "sarabanbot_ffmpeg_processes", "FFmpeg processes alive: songs playing and songs being stored in the audio cache", lambda: 0)
+EXTRACTOR_PHASES = Gauge(
+    "sarabanbot_extractor_phase_seconds_total", "Time spent in each yt-dlp extraction phase", lambda: {})
+CACHES = Gauge(
+    "sarabanbot_cache_events", "Hits, misses and size of the stream and audio caches", lambda: {})
+LOOP_LAG = Histogram(
+    "sarabanbot_event_loop_lag_seconds", "Delay of the event loop heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_STALLS = Gauge(
+    "sarabanbot_event_loop_blocked_seconds_total", "Time the event loop was blocked, by call site", lambda: {})
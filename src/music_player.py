@@ -1,14 +1,35 @@
 import asyncio
+import itertools
+import random
+import time
 import discord
 from .source import SpotifySource
-from config import FFMPEG_OPTIONS
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import timedelta, datetime as dt
+from .extractor import extractor
+from .timers import timers
+from .audio_cache import audio_cache
+from .deleter import deleter
+from .metrics import STREAM_RESOLVE, STREAM_RESOLVE_ERRORS, FIRST_AUDIO
+from config import FFMPEG_OPTIONS, PREFETCH_DEPTH, CLIP_MODE, CLIP_LENGTH, CLIP_OFFSET, AUDIO_BITRATE, AUDIO_FILTERS
+
+CLIP_MODES = ["off", "random", "chorus", "fixed"]
+
+
+class SongQueue(asyncio.Queue):
+    """asyncio.Queue that lets the prefetcher look at and drop the upcoming songs"""
+
+    def peek(self, n: int) -> list[tuple[int, SpotifySource]]:
+        return list(itertools.islice(self._queue, n))
+
+    def remove(self, item: tuple[int, SpotifySource]) -> None:
+        try:
+            self._queue.remove(item)
+        except ValueError:
+            pass
 
 
 class MusicPlayer:
 
-    def __init__(self, ctx: discord.ApplicationContext, bot: discord.Bot):
+    def __init__(self, ctx: discord.ApplicationContext, bot: discord.Bot, clip_mode: str = CLIP_MODE, clip_length: float = CLIP_LENGTH):
         self.bot = bot
         self.ctx = ctx
         self.vc = ctx.voice_client
@@ -16,16 +37,20 @@ class MusicPlayer:
         self._channel = ctx.channel
         self._cog = ctx.cog
 
-        self.queue = asyncio.Queue()
+        # only the songs about to be played are drawn, the prefetcher looks at the first PREFETCH_DEPTH
+        self.queue = SongQueue(maxsize=PREFETCH_DEPTH + 1)
         self.next = asyncio.Event()
 
         self.np = None  # Now playing message
         self.volume = 1
+        self.clip_mode = clip_mode
+        self.clip_length = clip_length
         self.current = None
         self.playing_song: tuple[int, SpotifySource] = None
-
-        self.scheduler = AsyncIOScheduler(timezone="Europe/Rome")
-        self.scheduler.start()
+        self.previous_song: SpotifySource = None
+        self.round = 0
+        self._prefetching: dict[SpotifySource, asyncio.Task] = dict()
+        self.stopped = False
 
         self.game = None
 
@@ -33,8 +58,118 @@ class MusicPlayer:
     def is_playing(self):
         return self.vc and self.current
 
+    @property
+    def ffmpeg_running(self) -> bool:
+        """The FFmpeg process of the current song is still alive"""
+        process = getattr(self.current, "_process", None)
+        return bool(process and process.poll() is None)
+
     async def add_to_queue(self, index: int, song: SpotifySource) -> None:
         await self.queue.put((index, song))
+        if song:
+            self.prefetch()
+
+    def prefetch(self) -> None:
+        """Resolve in background the stream urls of the next songs in the queue"""
+        for index, song in self.queue.peek(PREFETCH_DEPTH):
+            if not song:
+                break
+
+            task = self._prefetching.get(song)
+            if task and not task.done():
+                continue
+            if not song.stream_expired:
+                continue
+
+            self._prefetching[song] = asyncio.create_task(
+                self._prefetch_stream(index, song))
+
+    async def _prefetch_stream(self, index: int, song: SpotifySource) -> str:
+        """Songs in the audio cache don't need a stream url"""
+        if await audio_cache.contains(song.cache_key):
+            return None
+        return await self._resolve_stream(index, song)
+
+    async def _resolve_stream(self, index: int, song: SpotifySource) -> str:
+        """Look up the stream url, a song that can't be found is dropped from the queue"""
+        try:
+            with STREAM_RESOLVE.time():
+                stream_url = await extractor.get_stream(song)
+        except asyncio.TimeoutError:
+            print(f"Timeout nella ricerca di {song}")
+            stream_url = None
+        except Exception as e:
+            print(e)
+            stream_url = None
+
+        if not stream_url:
+            STREAM_RESOLVE_ERRORS.inc()
+            self.queue.remove((index, song))
+        return stream_url
+
+    async def get_stream(self, index: int, song: SpotifySource) -> str:
+        task = self._prefetching.get(song)
+        if not task or (task.done() and song.stream_expired):
+            task = asyncio.create_task(self._resolve_stream(index, song))
+            self._prefetching[song] = task
+
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if not self.stopped:
+                raise
+            return None
+        finally:
+            self._prefetching.pop(song, None)
+
+    def stop(self) -> None:
+        """Stop the player loop and cancel the pending lookups"""
+        self.stopped = True
+        timers.cancel_all(self)
+        for task in self._prefetching.values():
+            task.cancel()
+        self._prefetching.clear()
+
+    def get_clip(self, song: SpotifySource) -> tuple[float, float]:
+        """return offset, length of the part of the song to play"""
+        if self.clip_mode == "off" or song.duration <= self.clip_length:
+            return 0, song.duration
+
+        latest = song.duration - self.clip_length
+        if self.clip_mode == "random":
+            offset = random.uniform(0, latest)
+        elif self.clip_mode == "chorus":
+            # the first chorus usually comes around a third of the song
+            offset = random.triangular(
+                0.2 * song.duration, 0.6 * song.duration, 0.33 * song.duration)
+        else:
+            offset = CLIP_OFFSET
+
+        return min(max(offset, 0), latest), self.clip_length
+
+    def get_ffmpeg_options(self, offset: float, length: float, local: bool = False) -> dict[str, str]:
+        """`local` is for files from the audio cache, already encoded with AUDIO_FILTERS"""
+        before_options = "" if local else FFMPEG_OPTIONS["before_options"]
+        options = FFMPEG_OPTIONS["options"]
+
+        if self.clip_mode != "off":
+            # -ss before the input seeks on the input side, so only the clip gets downloaded
+            before_options = f"-ss {offset:.2f} {before_options}"
+            options += f" -t {length:.2f}"
+
+        filters = [f"volume={self.volume}"] if self.volume != 1 else []
+        if AUDIO_FILTERS and not local:
+            filters.append(AUDIO_FILTERS)
+        if filters:
+            options += f' -af "{",".join(filters)}"'
+
+        return {
+            "before_options": before_options,
+            "options": options,
+            # `codec` is the input codec: py-cord copies Opus input and encodes anything else,
+            # so cached Opus files with nothing to filter are only remuxed, not encoded again
+            "codec": "opus" if local and not filters else None,
+        }
 
     async def player_loop(self):
         """Our main player loop."""
@@ -42,7 +177,7 @@ class MusicPlayer:
 
         await self.ctx.bot.wait_until_ready()
 
-        while not self.ctx.bot.is_closed():
+        while not self.ctx.bot.is_closed() and not self.stopped:
             self.next.clear()
             self.game.clear_votes()
             self.playing_song = await self.queue.get()
@@ -53,14 +188,33 @@ class MusicPlayer:
                 await self.game.end()
                 return
 
+            round_started = time.perf_counter()
+
+            self.prefetch()
+            local_path = await audio_cache.get(song.cache_key)
+            if local_path:
+                stream_url = local_path
+            else:
+                stream_url = await self.get_stream(index, song)
+            if self.stopped:
+                return
+            if not stream_url:
+                print(f"Canzone non trovata: {song}")
+                continue
+
+            await audio_cache.record_play(
+                song.cache_key, None if local_path else stream_url)
+            offset, length = self.get_clip(song)
+
             try:
-                source = discord.PCMVolumeTransformer(
-                    discord.FFmpegPCMAudio(source=song.get_stream(), **FFMPEG_OPTIONS))
+                # already encoded by FFmpeg, the voice client sends the packets as they are
+                source = discord.FFmpegOpusAudio(
+                    source=stream_url, bitrate=AUDIO_BITRATE, **self.get_ffmpeg_options(offset, length, local=bool(local_path)))
             except (AttributeError, TypeError):
                 print("Errore nella riproduzione")
                 continue
 
-            source = discord.PCMVolumeTransformer(source, volume=self.volume)
+            self.round += 1
             self.current = source
 
             if not self._guild.voice_client:
@@ -69,35 +223,36 @@ class MusicPlayer:
             self._guild.voice_client.play(
                 # lambda _: self.ctx.bot.loop.call_soon_threadsafe(self.next.set))
                 source, after=self.play_next_song)
+            FIRST_AUDIO.observe(time.perf_counter() - round_started)
 
-            self.scheduler.add_job(
-                self.load_image, id=song.title, run_date=dt.now() + timedelta(seconds=song.duration/2))
+            image_timer = timers.call_later(
+                self, length / 2, self.load_image, song)
 
             embed = self.game.get_embed()
 
-            await self.game.edit_message(embed=embed, view=GameView(self._cog, self.bot, self.ctx, self.game))
+            await self.game.edit_message(embed=embed, view=GameView(self._cog, self.bot, self.ctx, self.game), flush=True)
+            # answers are checked only while the song is playing and its board is up
+            self.game.start_round(song)
 
             # self.np = await self._channel.send(embed=embed)
 
             await self.next.wait()
+            self.game.end_round()
+            image_timer.cancel()
 
             # Make sure the FFmpeg process is cleaned up.
             source.cleanup()
             self.current = None
+            self.previous_song = song
 
     def play_next_song(self, error=None):
+        """Called by the voice client from its player thread"""
         if error:
             print(error)
 
-        _, song = self.playing_song
-        job = self.scheduler.get_job(job_id=song.title)
-        if job:
-            job.remove()
-
-        self.next.set()
+        self.bot.loop.call_soon_threadsafe(self.next.set)
 
-    async def load_image(self):
-        _, song = self.playing_song
+    async def load_image(self, song: SpotifySource):
         await self.game.insert_image(song)
 
     async def destroy(self, ctx: discord.ApplicationContext):
@@ -110,4 +265,4 @@ class MusicPlayer:
             self.vc.stop()
 
         for m in song.messages:
-            await m.delete()
+            deleter.delete(m)
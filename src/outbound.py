@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable
+from config import OUTBOUND_ROUTE_BUDGETS, OUTBOUND_MAX_INFLIGHT
+
+
+class Priority(IntEnum):
+    HIGH = 0    # answers reveal, new round, game over
+    NORMAL = 1  # scoreboard updates
+    LOW = 2     # thumbnails, deletes
+
+
+class RouteBudget:
+    """Token bucket: at most `rate` requests every `per` seconds"""
+
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self._updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens +
+                          (now - self._updated) * self.rate / self.per)
+        self._updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) * self.per / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class Request:
+    __slots__ = ("priority", "seq", "route", "key", "func", "kwargs", "deadline", "futures", "superseded")
+
+    def __init__(self, priority: Priority, seq: int, route: str, key: str, func: Callable[..., Awaitable], kwargs: dict, deadline: float) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.key = key
+        self.func = func
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.futures: list[asyncio.Future] = list()
+        self.superseded = False
+
+    def __lt__(self, other: "Request") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def resolve(self, result: Any = None, error: Exception = None) -> None:
+        for future in self.futures:
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    """Errors are printed by the scheduler, callers that don't await their request don't need them"""
+    if not future.cancelled():
+        future.exception()
+
+
+class OutboundScheduler:
+    """
+    Queue of the Discord writes of a guild. Requests run by priority, each route within its budget
+    (OUTBOUND_ROUTE_BUDGETS); a request with the same key as a pending one supersedes it, merging its kwargs;
+    requests with a max_age still waiting after it are dropped (their result is None)
+    """
+
+    def __init__(self, budgets: dict[str, tuple[int, float]] = OUTBOUND_ROUTE_BUDGETS, max_inflight: int = OUTBOUND_MAX_INFLIGHT) -> None:
+        self._budgets = {route: RouteBudget(*budget)
+                         for route, budget in budgets.items()}
+        self._default_budget = budgets.get("default", (5, 5.0))
+        self._queue: list[Request] = list()
+        self._pending: dict[str, Request] = dict()  # key -> pending request
+        self._running_keys: set[str] = set()
+        self._seq = itertools.count()
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task = None
+        self._tasks: set[asyncio.Task] = set()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def _budget(self, route: str) -> RouteBudget:
+        if route not in self._budgets:
+            self._budgets[route] = RouteBudget(*self._default_budget)
+        return self._budgets[route]
+
+    def submit(self, route: str, func: Callable[..., Awaitable], priority: Priority = Priority.NORMAL, key: str = None, max_age: float = None, **kwargs) -> asyncio.Future:
+        """Queue `func(**kwargs)`, the returned future gets its result"""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+
+        request = Request(priority, next(self._seq), route, key, func, kwargs,
+                          time.monotonic() + max_age if max_age is not None else None)
+        old = self._pending.get(key) if key else None
+        if old:
+            old.superseded = True
+            self._queue.remove(old)
+            request.priority = min(old.priority, priority)
+            request.kwargs = {**old.kwargs, **kwargs}
+            request.futures = old.futures
+            # the merged request must not expire before any of the ones it replaces
+            if old.deadline is None or request.deadline is None:
+                request.deadline = None
+            else:
+                request.deadline = max(old.deadline, request.deadline)
+            self.coalesced += 1
+        request.futures.append(future)
+
+        self._queue.append(request)
+        if key:
+            self._pending[key] = request
+
+        self._wakeup.set()
+        if not self._worker or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return future
+
+    def _next_request(self) -> tuple[Request, float]:
+        """Highest priority request that can run now, otherwise the seconds to wait for one"""
+        now = time.monotonic()
+        wait = None
+
+        for request in sorted(self._queue):
+            if request.deadline is not None and request.deadline < now:
+                self._remove(request)
+                request.resolve(None)
+                self.dropped += 1
+                continue
+            if request.key in self._running_keys:
+                continue
+
+            route_wait = self._budget(request.route).wait_time()
+            if route_wait == 0:
+                return request, 0
+            wait = route_wait if wait is None else min(wait, route_wait)
+
+        return None, wait
+
+    def _remove(self, request: Request) -> None:
+        self._queue.remove(request)
+        if request.key and self._pending.get(request.key) is request:
+            del self._pending[request.key]
+
+    async def _run(self) -> None:
+        while self._queue:
+            self._wakeup.clear()
+            request, wait = self._next_request()
+
+            if not request:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._inflight.acquire()
+            if request.superseded or request not in self._queue:
+                self._inflight.release()
+                continue
+
+            self._remove(request)
+            self._budget(request.route).take()
+            if request.key:
+                self._running_keys.add(request.key)
+
+            task = asyncio.create_task(self._execute(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, request: Request) -> None:
+        try:
+            result = await request.func(**request.kwargs)
+        except Exception as e:
+            print(f"Errore nella richiesta {request.route}: {e}")
+            request.resolve(error=e)
+        else:
+            request.resolve(result)
+        finally:
+            self.sent += 1
+            self._running_keys.discard(request.key)
+            self._inflight.release()
+            self._wakeup.set()
+            if self._queue and (not self._worker or self._worker.done()):
+                self._worker = asyncio.create_task(self._run())
+
+
+_schedulers: dict[int, OutboundScheduler] = dict()
+
+
+def get_scheduler(guild_id: int) -> OutboundScheduler:
+    if guild_id not in _schedulers:
+        _schedulers[guild_id] = OutboundScheduler()
+    return _schedulers[guild_id]
+
+
+def close_scheduler(guild_id: int) -> None:
+    """The requests already queued still run"""
+    _schedulers.pop(guild_id, None)
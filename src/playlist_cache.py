@@ -0,0 +1,284 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from .catalog import Track, catalog
+from .utils import parse_tracks
+from .storage import Database, run_in_thread
+from config import SPOTIFY, PLAYLIST_REFRESH_INTERVAL, PLAYLIST_IDLE_TTL, PLAYLIST_FETCH_CONCURRENCY, PLAYLIST_CACHE_PATH
+
+
+class CachedPlaylist:
+    """
+    Parsed Spotify playlist. It's returned as soon as the first page is in,
+    `tracks` keeps growing while the other pages arrive and `ready` is set when it's complete
+    """
+
+    def __init__(self, id_: str, name: str, snapshot_id: str, total: int) -> None:
+        self.id = id_
+        self.name = name
+        self.snapshot_id = snapshot_id
+        self.total = total
+        self.tracks: list[Track] = list()
+        self.checked_at = time.time()
+        self.used_at = time.time()
+        self.incomplete = False  # some pages failed: downloaded again at the next load
+        self.ready = asyncio.Event()
+        self.changed = asyncio.Event()
+
+    def add_tracks(self, tracks: list[Track]) -> None:
+        self.tracks.extend(tracks)
+        self._notify()
+
+    def set_ready(self) -> None:
+        self.ready.set()
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+async def wait_for_songs(playlists: list[CachedPlaylist], songs_number: int) -> None:
+    """Wait until the playlists together have `songs_number` songs loaded, or are complete"""
+    while sum(len(p.tracks) for p in playlists) < songs_number:
+        loading = [p for p in playlists if not p.ready.is_set()]
+        if not loading:
+            return
+
+        waiters = [asyncio.create_task(p.changed.wait()) for p in loading]
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        for waiter in waiters:
+            waiter.cancel()
+
+
+class PlaylistStore:
+    """
+    Complete playlists saved in SQLite, so they survive restarts and the
+    worker processes of a sharded bot reuse each other's downloads
+    """
+
+    def __init__(self, path: str = PLAYLIST_CACHE_PATH) -> None:
+        self._lock = threading.Lock()
+        self._db = Database(
+            path,
+            "CREATE TABLE IF NOT EXISTS playlists ("
+            "id TEXT PRIMARY KEY, name TEXT, snapshot_id TEXT, total INTEGER, "
+            "tracks TEXT, checked_at REAL)")
+
+    def info(self, playlist_id: str) -> tuple[str, float]:
+        """snapshot_id and last check of the stored playlist"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT snapshot_id, checked_at FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+
+    def load(self, playlist_id: str) -> tuple[str, str, int, list[list], float]:
+        """name, snapshot_id, total, tracks (as catalog.intern arguments) and last check"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT name, snapshot_id, total, tracks, checked_at FROM playlists WHERE id = ?",
+                (playlist_id,)).fetchone()
+        if not row:
+            return None
+        name, snapshot_id, total, tracks, checked_at = row
+        return name, snapshot_id, total, json.loads(tracks), checked_at
+
+    def save(self, playlist: CachedPlaylist) -> None:
+        tracks = json.dumps([
+            [t.id, t.title, t.artists, t.image, round(t.duration * 1000), t.link, t.isrc, t.album]
+            for t in playlist.tracks])
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?, ?, ?)",
+                (playlist.id, playlist.name, playlist.snapshot_id, playlist.total, tracks, playlist.checked_at))
+            self._db.commit()
+
+    def touch(self, playlist: CachedPlaylist) -> None:
+        """The playlist was found unchanged on Spotify"""
+        with self._lock:
+            self._db.execute("UPDATE playlists SET checked_at = ? WHERE id = ?",
+                             (playlist.checked_at, playlist.id))
+            self._db.commit()
+
+
+class PlaylistCache:
+    """
+    Process-wide cache of the parsed Spotify playlists, shared by every guild.
+    A playlist is downloaded again only when its snapshot_id changes.
+    The playlists passed to keep_fresh are kept up to date, the others are dropped after `idle_ttl` seconds unused.
+    With a `store` the complete playlists are also kept on disk for the other processes
+    """
+
+    def __init__(self, refresh_interval: float = PLAYLIST_REFRESH_INTERVAL, concurrency: int = PLAYLIST_FETCH_CONCURRENCY,
+                 store: PlaylistStore = None, idle_ttl: float = PLAYLIST_IDLE_TTL) -> None:
+        self.refresh_interval = refresh_interval
+        self.idle_ttl = idle_ttl
+        self.store = store
+        self._playlists: dict[str, CachedPlaylist] = dict()
+        self._kept: set[str] = set()
+        self._loading: dict[str, asyncio.Task] = dict()
+        self._background: set[asyncio.Task] = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._refresher: asyncio.Task = None
+
+    @staticmethod
+    def playlist_id(playlist_url: str) -> str:
+        """Accepts playlist urls, URIs or plain ids"""
+        playlist_url = playlist_url.strip().split("?")[0].rstrip("/")
+        return playlist_url.split("/")[-1].split(":")[-1]
+
+    def get(self, playlist_url: str) -> CachedPlaylist:
+        """Cached playlist, without any network call"""
+        cached = self._playlists.get(self.playlist_id(playlist_url))
+        if cached:
+            cached.used_at = time.time()
+        return cached
+
+    async def fetch(self, playlist_url: str) -> CachedPlaylist:
+        """Cached playlist right away (revalidated in background if old), otherwise load it"""
+        cached = self.get(playlist_url)
+        if not cached:
+            return await self.load(playlist_url)
+
+        if cached.incomplete or time.time() - cached.checked_at > self.refresh_interval:
+            self._run_in_background(self.load(playlist_url))
+        return cached
+
+    async def load(self, playlist_url: str) -> CachedPlaylist:
+        """Validate the cached playlist with its snapshot_id, download it again if changed"""
+        playlist_id = self.playlist_id(playlist_url)
+
+        task = self._loading.get(playlist_id)
+        if not task:
+            task = asyncio.create_task(self._load(playlist_id))
+            self._loading[playlist_id] = task
+            task.add_done_callback(
+                lambda _: self._loading.pop(playlist_id, None))
+
+        return await asyncio.shield(task)
+
+    async def _load(self, playlist_id: str) -> CachedPlaylist:
+        cached = self._playlists.get(playlist_id)
+        if self.store:
+            # another process may have checked or downloaded it more recently
+            stored = await run_in_thread(self.store.info, playlist_id)
+            if stored and (not cached or stored[1] > cached.checked_at):
+                if not cached or cached.incomplete or cached.snapshot_id != stored[0]:
+                    cached = await self._restore(playlist_id) or cached
+                if cached and not cached.incomplete:
+                    cached.checked_at = max(cached.checked_at, stored[1])
+                    if time.time() - cached.checked_at < self.refresh_interval:
+                        return cached
+
+        if cached and not cached.incomplete:
+            playlist = await self._spotify(SPOTIFY.playlist, playlist_id, fields="snapshot_id")
+            if playlist["snapshot_id"] == cached.snapshot_id:
+                cached.checked_at = time.time()
+                if self.store:
+                    await run_in_thread(self.store.touch, cached)
+                return cached
+
+        playlist = await self._spotify(SPOTIFY.playlist, playlist_id)
+        tracks = playlist["tracks"]
+
+        cached = CachedPlaylist(
+            id_=playlist_id,
+            name=playlist["name"],
+            snapshot_id=playlist["snapshot_id"],
+            total=tracks["total"],
+        )
+        cached.add_tracks(parse_tracks(tracks["items"]))
+        self._playlists[playlist_id] = cached
+
+        if tracks["next"]:
+            self._run_in_background(self._load_pages(
+                cached, offset=len(tracks["items"]), limit=tracks["limit"]))
+        else:
+            await self._loaded(cached)
+
+        return cached
+
+    async def _load_pages(self, playlist: CachedPlaylist, offset: int, limit: int) -> None:
+        """Download concurrently the remaining pages, at most `concurrency` at a time"""
+        async def load_page(page_offset: int) -> None:
+            page = await self._spotify(SPOTIFY.playlist_items, playlist.id, limit=limit, offset=page_offset)
+            playlist.add_tracks(parse_tracks(page["items"]))
+
+        complete = False
+        try:
+            results = await asyncio.gather(
+                *[load_page(page_offset)
+                  for page_offset in range(offset, playlist.total, limit)],
+                return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            for error in errors:
+                print(f"Errore caricando {playlist.name}: {error}")
+            complete = not errors
+        finally:
+            playlist.incomplete = not complete
+            await self._loaded(playlist, save=complete)
+
+    async def _restore(self, playlist_id: str) -> CachedPlaylist:
+        stored = await run_in_thread(self.store.load, playlist_id)
+        if not stored:
+            return None
+
+        name, snapshot_id, total, tracks, checked_at = stored
+        playlist = CachedPlaylist(
+            id_=playlist_id, name=name, snapshot_id=snapshot_id, total=total)
+        playlist.add_tracks([catalog.intern(*track) for track in tracks])
+        playlist.checked_at = checked_at
+        playlist.set_ready()
+        self._playlists[playlist_id] = playlist
+        return playlist
+
+    async def _loaded(self, playlist: CachedPlaylist, save: bool = True) -> None:
+        playlist.set_ready()
+        if self.store and save:
+            try:
+                await run_in_thread(self.store.save, playlist)
+            except sqlite3.Error as e:
+                print(f"Errore salvando la playlist {playlist.name}: {e}")
+
+    async def _spotify(self, method: callable, *args, **kwargs) -> dict:
+        """spotipy is blocking, run it off the event loop"""
+        async with self._slots:
+            return await run_in_thread(method, *args, **kwargs)
+
+    def _run_in_background(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def refresh(self, playlists_urls: list[str]) -> None:
+        for playlist_url in playlists_urls:
+            try:
+                await self.load(playlist_url)
+            except Exception as e:
+                print(f"Errore aggiornando la playlist {playlist_url}: {e}")
+
+    def expire(self) -> None:
+        """Drop the playlists not kept fresh and unused for `idle_ttl` seconds"""
+        now = time.time()
+        for playlist_id, cached in list(self._playlists.items()):
+            if playlist_id not in self._kept and playlist_id not in self._loading and now - cached.used_at > self.idle_ttl:
+                del self._playlists[playlist_id]
+
+    def keep_fresh(self, playlists_urls: list[str]) -> None:
+        """Start the background task that keeps the playlists up to date"""
+        self._kept.update(map(self.playlist_id, playlists_urls))
+        if self._refresher and not self._refresher.done():
+            return
+
+        async def refresher():
+            while True:
+                self.expire()
+                await self.refresh(list(self._kept))
+                await asyncio.sleep(self.refresh_interval)
+
+        self._refresher = asyncio.create_task(refresher())
+
+
+playlist_cache = PlaylistCache(
+    store=PlaylistStore() if PLAYLIST_CACHE_PATH else None)
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from config import PROFILE_INTERVAL, PROFILE_DIR
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "control"}
+
+
+@dataclass
+class Profile:
+    started_at: float
+    duration: float = 0.0
+    samples: int = 0
+    stacks: Counter = field(default_factory=Counter)     # folded stack -> samples
+    tasks: Counter = field(default_factory=Counter)      # coroutine -> samples
+    functions: Counter = field(default_factory=Counter)  # innermost function -> samples
+
+    def folded(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and inferno"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 10) -> str:
+        if not self.samples:
+            return "No samples collected"
+
+        def percent(count: int) -> str:
+            return f"{100 * count / self.samples:5.1f}%"
+
+        lines = [f"{self.samples} samples in {self.duration:.1f}s"]
+        lines.append("Coroutines:")
+        lines.extend(f"{percent(count)}  {name}" for name, count in self.tasks.most_common(top))
+        lines.append("Functions (self time):")
+        lines.extend(f"{percent(count)}  {name}" for name, count in self.functions.most_common(top))
+        return "\n".join(lines)
+
+    def save(self, directory: str = PROFILE_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime(
+            "profile-%Y%m%d-%H%M%S.folded", time.localtime(self.started_at)))
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the event loop thread from a separate thread every `interval` seconds,
+    nothing is hooked into the running code so it can be started while games are running.
+    Every sample is attributed to the asyncio task running in that moment
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL) -> None:
+        self.interval = interval
+        self.profile: Profile = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    async def run(self, seconds: float) -> Profile:
+        """Profile the event loop for `seconds`, returns early if stop() is called"""
+        if self.running:
+            raise RuntimeError("Profiler already running")
+
+        loop = asyncio.get_running_loop()
+        self.profile = Profile(started_at=time.time())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, args=(loop, threading.get_ident()),
+                                        name="profiler", daemon=True)
+        self._thread.start()
+
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(None, self._wait, seconds)
+        finally:
+            self._stop.set()
+            self.profile.duration = time.perf_counter() - start
+        return self.profile
+
+    def _wait(self, seconds: float) -> None:
+        self._stop.wait(seconds)
+        self._stop.set()
+        self._thread.join()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int) -> None:
+        profile = self.profile
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(loop)
+            stack = self._stack(frame)
+            root = self._task_name(task, stack)
+
+            profile.samples += 1
+            profile.tasks[root] += 1
+            profile.functions[stack[-1]] += 1
+            profile.stacks[";".join((root, *stack))] += 1
+
+    @staticmethod
+    def _stack(frame) -> list[str]:
+        """Frames from the outermost to the innermost, without the event loop machinery"""
+        frames = list()
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        frames.reverse()
+
+        # everything up to Handle._run is the loop itself: keep the callback or task step
+        for i in range(len(frames) - 1, -1, -1):
+            code = frames[i].f_code
+            if code.co_name == "_run" and code.co_filename.startswith(ASYNCIO_DIR):
+                frames = frames[i + 1:] or frames[i:]
+                break
+        return [f"{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_name}" for f in frames]
+
+    @staticmethod
+    def _task_name(task: asyncio.Task, stack: list[str]) -> str:
+        if task is not None:
+            coro = task.get_coro()
+            return getattr(coro, "__qualname__", task.get_name())
+        if stack[-1].rsplit(":", 1)[-1] in IDLE_FUNCTIONS:
+            return "(idle)"
+        return "(callbacks)"
+
+
+profiler = SamplingProfiler()
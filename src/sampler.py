@@ -0,0 +1,59 @@
+import random
+from typing import AsyncIterator
+from .catalog import Track
+from .playlist_cache import CachedPlaylist, wait_for_songs
+
+
+class PlaylistDraw:
+    """
+    Random indexes of a playlist without replacement: a lazy Fisher-Yates shuffle, O(1) per draw.
+    Drawn tracks are swapped to the front, so the tracks still loading join the draw when they arrive
+    """
+
+    def __init__(self, playlist: CachedPlaylist) -> None:
+        self.tracks = playlist.tracks
+        self.drawn = 0
+        self._swapped: dict[int, int] = dict()
+
+    @property
+    def remaining(self) -> int:
+        return len(self.tracks) - self.drawn
+
+    def draw(self) -> Track:
+        i = random.randrange(self.drawn, len(self.tracks))
+        track_index = self._swapped.get(i, i)
+        self._swapped[i] = self._swapped.pop(self.drawn, self.drawn)
+        self.drawn += 1
+        return self.tracks[track_index]
+
+
+async def sample_tracks(playlists: list[CachedPlaylist], songs_number: int, weights: list[float] = None) -> AsyncIterator[Track]:
+    """
+    Draw up to `songs_number` different tracks from the playlists, without building their union.
+    Each draw picks a playlist, proportionally to `weights` times its remaining tracks
+    (so by default every track has the same chance), then one of its tracks not drawn yet.
+    Tracks already drawn from another playlist (same Spotify id or ISRC) are skipped.
+    Songs are drawn as they are requested, so the ones loaded in the meantime can be picked
+    """
+    draws = [PlaylistDraw(playlist) for playlist in playlists]
+    weights = weights or [1] * len(draws)
+    seen_ids, seen_isrcs = set(), set()
+    drawn = 0
+
+    while drawn < songs_number:
+        chances = [weight * d.remaining for weight, d in zip(weights, draws)]
+        if not any(chances):
+            if all(p.ready.is_set() for p in playlists):
+                return
+            await wait_for_songs(playlists, sum(len(p.tracks) for p in playlists) + 1)
+            continue
+
+        track = random.choices(draws, weights=chances)[0].draw()
+        if track.id in seen_ids or (track.isrc and track.isrc in seen_isrcs):
+            continue
+
+        seen_ids.add(track.id)
+        if track.isrc:
+            seen_isrcs.add(track.isrc)
+        drawn += 1
+        yield track
@@ -1,20 +1,24 @@
-import yt_dlp
-from config import YTDL_OPTIONS
+import time
+from urllib.parse import urlparse, parse_qs
+from .extractor import extractor
+from .stream_cache import stream_cache
+from .catalog import Track
+from config import STREAM_URL_TTL, STREAM_URL_REFRESH_MARGIN
 import discord
 
 
 class SpotifySource():
+    """A catalog track as played in a game: its stream and what was guessed in the round"""
 
-    def __init__(self, id_: str, title: str, artists: list[str], image: str, duration: int, link: str, isrc: str,  album: str = None) -> None:
-        self.id = id_
-        self.title = title
-        self.artists = artists
-        self.image = image
-        self.duration = duration / 1000
-        self.link = link
-        self.isrc = isrc
-        self.album = album
+    __slots__ = ("track", "stream_url", "stream_expires_at", "title_guessed", "guessed_artists",
+                 "guessed_metadata", "messages")
+
+    def __init__(self, track: Track) -> None:
+        self.track = track
         self.stream_url = None
+        self.stream_expires_at = 0.0
+        self.title_guessed = False
+        self.guessed_artists = 0  # bit i set when artists[i] has been guessed
         self.guessed_metadata = {
             "title": (),    # (player, title_attemp, points)
             "artists": {},  # user : plyer,
@@ -22,40 +26,101 @@ class SpotifySource():
         }
         self.messages: list[discord.Message] = list()
 
-    def __eq__(self, __o: object) -> bool:
-        return isinstance(__o, SpotifySource) and __o.id == self.id
+    def __repr__(self) -> str:
+        return repr(self.track)
 
-    def __hash__(self) -> int:
-        return hash(self.id)
+    @property
+    def id(self) -> str:
+        return self.track.id
 
-    def __repr__(self) -> str:
-        return f"{self.title} - {', '.join(self.artists)} [{self.album}]"
+    @property
+    def title(self) -> str:
+        return self.track.title
+
+    @property
+    def artists(self) -> tuple[str, ...]:
+        return self.track.artists
+
+    @property
+    def image(self) -> str:
+        return self.track.image
+
+    @property
+    def duration(self) -> float:
+        return self.track.duration
+
+    @property
+    def link(self) -> str:
+        return self.track.link
+
+    @property
+    def isrc(self) -> str:
+        return self.track.isrc
+
+    @property
+    def album(self) -> str:
+        return self.track.album
+
+    @property
+    def cache_key(self) -> str:
+        return self.track.cache_key
+
+    def is_artist_guessed(self, index: int) -> bool:
+        return bool(self.guessed_artists >> index & 1)
+
+    def guess_artist(self, index: int) -> None:
+        self.guessed_artists |= 1 << index
+
+    @property
+    def artists_text(self) -> str:
+        """Artists field of the board: the guessed ones, ??? for the others"""
+        guessed = [a for i, a in enumerate(self.artists)
+                   if self.is_artist_guessed(i)]
+        if len(guessed) < len(self.artists):
+            guessed.append("???")
+        return ", ".join(guessed)
+
+    @property
+    def stream_expired(self) -> bool:
+        """True if there's no stream url or it is about to expire"""
+        return not self.stream_url or time.time() + STREAM_URL_REFRESH_MARGIN >= self.stream_expires_at
+
+    def _set_stream_url(self, url: str) -> None:
+        self.stream_url = url
+        try:
+            self.stream_expires_at = float(
+                parse_qs(urlparse(url).query)["expire"][0])
+        except (KeyError, ValueError):
+            self.stream_expires_at = time.time() + STREAM_URL_TTL
 
     def get_stream(self) -> str:
-        if self.isrc:
+        key = self.cache_key
+        with extractor.timed("cache"):
+            cached = stream_cache.get(key)
+
+        if cached and cached.stream_url:
+            self.stream_url = cached.stream_url
+            self.stream_expires_at = cached.expires_at
+            return self.stream_url
+
+        if cached and cached.video_id:
+            query = f"https://www.youtube.com/watch?v={cached.video_id}"
+        elif self.isrc:
             query = self.isrc
         else:
             query = f"{self.title} - {','.join(self.artists)}".replace(
                 ":", "").replace('"', "")
 
-        YTDL_OPTIONS["postprocessor_args"] = [
-            "-metadata",
-            f"title={self.title}",
-            "-metadata",
-            f"artist={','.join(self.artists)}",
-            "-metadata",
-            f"album={self.album}",
-        ]
-
-        with yt_dlp.YoutubeDL(YTDL_OPTIONS) as ydl:
-            result = ydl.extract_info(query, download=False)
-
-            if "entries" in result:
-                try:
-                    self.stream_url = result["entries"][0]["url"]
-                except IndexError:
-                    return None
-            else:
-                self.stream_url = result["url"]
+        result = extractor.extract_info(query)
+
+        if "entries" in result:
+            try:
+                result = result["entries"][0]
+            except IndexError:
+                return None
+
+        self._set_stream_url(result["url"])
+        stream_cache.put(key, result.get("id"),
+                         self.stream_url, self.stream_expires_at)
 
         return self.stream_url
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import Executor
+
+
+class Database:
+    """
+    SQLite file shared by the caches of every worker process (WAL mode, waits for the write lock).
+    It's opened on first use, so importing a cache module creates no file
+    """
+
+    def __init__(self, path: str, *schema: str) -> None:
+        self.path = path
+        self.schema = schema
+        self._connection: sqlite3.Connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._connection is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                for statement in self.schema:
+                    db.execute(statement)
+                db.commit()
+                self._connection = db
+        return self._connection
+
+    def execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        return self.connection.execute(sql, parameters)
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+
+async def run_in_thread(method: callable, *args, executor: Executor = None, **kwargs):
+    """Run a blocking call off the event loop, on `executor` or the default one"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
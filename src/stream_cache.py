@@ -0,0 +1,84 @@
+import threading
+import time
+import unidecode
+from dataclasses import dataclass
+from .storage import Database
+from config import STREAM_CACHE_PATH, STREAM_CACHE_SIZE, STREAM_URL_REFRESH_MARGIN
+
+
+@dataclass
+class CachedStream:
+    video_id: str
+    stream_url: str
+    expires_at: float
+
+
+class StreamCache:
+    """
+    SQLite cache of the yt-dlp lookups, keyed by ISRC or by normalized title and artists.
+    The video id is kept until the entry is evicted (LRU), the stream url only until it expires
+    """
+
+    def __init__(self, path: str = STREAM_CACHE_PATH, max_entries: int = STREAM_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self.hits = 0           # valid stream url found
+        self.video_hits = 0     # only the video id was still usable
+        self.misses = 0
+        self.size = 0           # entries, as seen at the last write
+
+        self._lock = threading.Lock()
+        self._db = Database(
+            path,
+            "CREATE TABLE IF NOT EXISTS streams ("
+            "key TEXT PRIMARY KEY, video_id TEXT, stream_url TEXT, "
+            "expires_at REAL, last_used REAL)",
+            "CREATE INDEX IF NOT EXISTS streams_last_used ON streams (last_used)")
+
+    @staticmethod
+    def key(isrc: str, title: str, artists: list[str]) -> str:
+        if isrc:
+            return f"isrc:{isrc.upper()}"
+        normalized = [unidecode.unidecode(x).lower().strip()
+                      for x in [title, *artists]]
+        return "song:" + "|".join(normalized)
+
+    def get(self, key: str) -> CachedStream:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT video_id, stream_url, expires_at FROM streams WHERE key = ?", (key,)).fetchone()
+
+            if not row:
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE streams SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+        cached = CachedStream(*row)
+        if cached.stream_url and cached.expires_at > time.time() + STREAM_URL_REFRESH_MARGIN:
+            self.hits += 1
+        else:
+            cached.stream_url = None
+            self.video_hits += 1
+        return cached
+
+    def put(self, key: str, video_id: str, stream_url: str, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO streams VALUES (?, ?, ?, ?, ?)",
+                (key, video_id, stream_url, expires_at, time.time()))
+            self._db.execute(
+                "DELETE FROM streams WHERE key IN ("
+                "SELECT key FROM streams ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self._db.commit()
+            self.size = self._db.execute(
+                "SELECT COUNT(*) FROM streams").fetchone()[0]
+
+    def stats(self) -> dict[str, int]:
+        """Counters only: it's read by the metrics scrape on the event loop, the database may be locked"""
+        return {"hits": self.hits, "video_hits": self.video_hits, "misses": self.misses, "size": self.size}
+
+
+stream_cache = StreamCache()
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class Timer:
+    """Cancellable handle of a callback scheduled with TimerService"""
+
+    __slots__ = ("owner", "_handle", "_service")
+
+    def __init__(self, owner: Any, service: "TimerService") -> None:
+        self.owner = owner
+        self._handle: asyncio.TimerHandle = None
+        self._service = service
+
+    @property
+    def cancelled(self) -> bool:
+        return self._handle.cancelled()
+
+    def cancel(self) -> None:
+        self._handle.cancel()
+        self._service._discard(self)
+
+
+class TimerService:
+    """
+    Process-wide timers on the event loop, each one owned by a game (or any object)
+    so all its timers can be cancelled at once when it ends
+    """
+
+    def __init__(self) -> None:
+        self._timers: dict[Any, set[Timer]] = dict()
+        self._tasks: set[asyncio.Task] = set()
+
+    def call_later(self, owner: Any, delay: float, callback: Callable[..., Awaitable], *args) -> Timer:
+        """Run the coroutine function `callback(*args)` in `delay` seconds"""
+        timer = Timer(owner, self)
+
+        def fire() -> None:
+            self._discard(timer)
+            task = asyncio.create_task(callback(*args))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        timer._handle = asyncio.get_running_loop().call_later(delay, fire)
+        self._timers.setdefault(owner, set()).add(timer)
+        return timer
+
+    def cancel_all(self, owner: Any) -> None:
+        for timer in list(self._timers.get(owner, ())):
+            timer.cancel()
+
+    def _discard(self, timer: Timer) -> None:
+        timers = self._timers.get(timer.owner)
+        if timers is None:
+            return
+        timers.discard(timer)
+        if not timers:
+            del self._timers[timer.owner]
+
+    def __len__(self) -> int:
+        return sum(len(timers) for timers in self._timers.values())
+
+
+timers = TimerService()
@@ -1,33 +1,30 @@
-from .source import SpotifySource
-from config import SPOTIFY
+from .catalog import Track, catalog
 import discord
 import re
 import unidecode
 import string
 
 
-def parse_playlist(playlist_url: str) -> tuple[str, list[SpotifySource]]:
-    playlist = SPOTIFY.playlist(playlist_url)
+def parse_tracks(items: list[dict]) -> list[Track]:
+    tracks = list()
 
-    playlist_name = playlist["name"]
-
-    sources = list()
-
-    for song in playlist["tracks"]["items"]:
-        sources.append(
-            SpotifySource(
+    for song in items:
+        if not song["track"]:
+            continue
+        tracks.append(
+            catalog.intern(
                 id_=song["track"]["id"],
                 title=song["track"]["name"],
                 artists=[artist["name"]
                          for artist in song["track"]["artists"]],
                 image=song["track"]["album"]["images"][0]["url"] if "album" in song["track"] else None,
                 link=song["track"]["external_urls"]["spotify"],
-                duration=song["track"]["duration_ms"],
+                duration_ms=song["track"]["duration_ms"],
                 isrc=song["track"]["external_ids"]["isrc"] if "isrc" in song["track"]["external_ids"] else None,
                 album=song["track"]["album"]["name"] if "album" in song["track"] else None
             ))
 
-    return playlist_name, sources
+    return tracks
 
 
 def get_field(fields: list[discord.EmbedField], key: str) -> tuple[int, discord.EmbedField]:
@@ -39,23 +36,23 @@ def get_field(fields: list[discord.EmbedField], key: str) -> tuple[int, discord.
     return None, None
 
 
+def fields_index(fields: list[discord.EmbedField]) -> dict[str, int]:
+    """field name (lowercase) -> pos"""
+    return {field.name.lower(): i for i, field in enumerate(fields)}
+
+
+PARENTHESES = re.compile(r"\(.+\)")
+PUNCTUATION = str.maketrans("", "", string.punctuation)
+
+
 def normalize(name: str) -> str:
 
-    name = unidecode.unidecode(name)
+    if not name.isascii():
+        name = unidecode.unidecode(name)
     name = name.lower().split(" - ")[0]
     # name = re.sub("\(with .+\)", "", name)
     # name = re.sub("\(feat\. .+\)", "", name)
-    name = re.sub("\(.+\)", "", name)
-
-    for x in string.punctuation:
-        name = name.replace(x, "")
+    name = PARENTHESES.sub("", name)
+    name = name.translate(PUNCTUATION)
 
     return name.strip()
-
-
-def compare_words(string: str, pattern: str) -> bool:
-
-    string = normalize(string)
-    pattern = normalize(pattern)
-
-    return string == pattern
@@ -1,9 +1,9 @@
 from __future__ import annotations
 import discord
 from .game_components.game import Game
-from config import PLAYLISTS
-from .utils import parse_playlist
-import random
+from .source import SpotifySource
+from .sampler import sample_tracks
+from .playlist_cache import CachedPlaylist, playlist_cache, wait_for_songs
 
 PLAYLIST_DROPDOWN_ID = "settings:dropdown:playlist"
 ADD_PLAYLIST_BTN_ID = "settings:button:add_playlist"
@@ -22,30 +22,28 @@ class MyModal(discord.ui.Modal):
         )
 
     async def callback(self, interaction: discord.Interaction):
-        playlist_name, sources = parse_playlist(
-            playlist_url=self.children[0].value)
+        playlist = await playlist_cache.fetch(self.children[0].value)
         playlist_dropdown: PlaylistDropdown = self.view.get_item(
             PLAYLIST_DROPDOWN_ID)
-        playlist_dropdown.playlists.update({playlist_name: sources})
+        playlist_dropdown.playlists.update({playlist.name: playlist})
         playlist_dropdown.add_option(
-            label=playlist_name, description=f"{len(sources)} songs", emoji="➕")
+            label=playlist.name, description=f"{playlist.total} songs", emoji="➕")
         playlist_dropdown.max_values += 1
 
         await interaction.response.edit_message(view=self.view)
 
 
 class PlaylistDropdown(discord.ui.Select):
-    def __init__(self, bot_: discord.Bot) -> None:
+    def __init__(self, bot_: discord.Bot, playlists: dict[str, CachedPlaylist]) -> None:
         self.bot = bot_
-        self.playlists = dict()
+        self.playlists: dict[str, CachedPlaylist] = dict()
         options = list()
 
-        for emoji, link in PLAYLISTS.items():
-            playlist_name, sources = parse_playlist(playlist_url=link)
-            self.playlists.update({playlist_name: sources})
+        for emoji, playlist in playlists.items():
+            self.playlists.update({playlist.name: playlist})
             options.append(
                 discord.SelectOption(
-                    label=playlist_name, description=f"{len(sources)} songs", emoji=emoji
+                    label=playlist.name, description=f"{playlist.total} songs", emoji=emoji
                 ))
 
         super().__init__(
@@ -62,12 +60,12 @@ class PlaylistDropdown(discord.ui.Select):
 
 class SettingsView(discord.ui.View):
 
-    def __init__(self, cog: discord.Cog, bot: discord.Bot, ctx: discord.ApplicationContext) -> None:
+    def __init__(self, cog: discord.Cog, bot: discord.Bot, ctx: discord.ApplicationContext, playlists: dict[str, CachedPlaylist]) -> None:
         self.cog = cog
         self.bot = bot
         self.ctx = ctx
         super().__init__()
-        self.add_item(PlaylistDropdown(bot_=self.bot))
+        self.add_item(PlaylistDropdown(bot_=self.bot, playlists=playlists))
 
     async def start_game(self, dropdown: PlaylistDropdown, interaction: discord.Interaction) -> None:
         game: Game = self.cog._get_game(interaction.guild)
@@ -84,14 +82,14 @@ class SettingsView(discord.ui.View):
         self.clear_items()
         await interaction.response.edit_message(embed=embed, view=self)
 
-        songs = set()
+        playlists = [dropdown.playlists[playlist_selected]
+                     for playlist_selected in dropdown.values]
+        # big playlists keep loading, the game starts as soon as there are enough songs
+        await wait_for_songs(playlists, game.songs_number)
 
-        for playlist_selected in dropdown.values:
-            songs = songs.union(set(dropdown.playlists[playlist_selected]))
-
-        # await game.add_songs(songs, dropdown.values)
-        await game.add_songs(random.choices(
-            [*songs], k=game.songs_number), dropdown.values)
+        # catalog tracks are shared between guilds, the round state is per game
+        game.add_songs((SpotifySource(track) async for track in sample_tracks(
+            playlists, game.songs_number)), dropdown.values)
         await game.start()
 
     @discord.ui.button(label="Add Playlist", style=discord.ButtonStyle.green, custom_id=ADD_PLAYLIST_BTN_ID, emoji="➕")
@@ -115,6 +113,6 @@ class GameView(discord.ui.View):
         if len(voters) > 0:
             button.label = f"Skip {len(voters)}/{len(self.game.players)}"
 
-            embed = self.game.get_embed(embed=interaction.message.embeds[0])
+            embed = self.game.get_embed(embed=self.game.current_embed)
 
             await interaction.response.edit_message(embed=embed, view=self)
@@ -0,0 +1,47 @@
+import os
+import types
+import pytest
+
+discord = pytest.importorskip("discord")
+pytest.importorskip("spotipy")
+# config.py builds the Spotify client on import, nothing is contacted
+os.environ.setdefault("SPOTIPY_CLIENT_ID", "test")
+os.environ.setdefault("SPOTIPY_CLIENT_SECRET", "test")
+
+from src.music_player import MusicPlayer  # noqa: E402
+
+
+def ffmpeg_args(monkeypatch, clip_mode: str = "off", volume: float = 1, local: bool = False) -> list[str]:
+    """argv that FFmpegOpusAudio would run for the options built by MusicPlayer"""
+    player = MusicPlayer.__new__(MusicPlayer)
+    player.clip_mode = clip_mode
+    player.volume = volume
+
+    captured = []
+    def spawn(self, args, **kwargs):
+        captured.extend(args)
+        return types.SimpleNamespace(stdout=None, stdin=None)
+
+    monkeypatch.setattr(discord.FFmpegOpusAudio, "_spawn_process", spawn)
+    monkeypatch.setattr(discord.FFmpegOpusAudio, "cleanup", lambda self: None)
+    discord.FFmpegOpusAudio("song", bitrate=128, **player.get_ffmpeg_options(45, 30, local=local))
+    return captured
+
+
+def test_remote_stream_is_encoded(monkeypatch):
+    args = ffmpeg_args(monkeypatch)
+    assert args[args.index("-c:a") + 1] == "libopus"
+
+
+def test_filters_are_never_applied_to_a_copied_stream(monkeypatch):
+    for local in (False, True):
+        args = ffmpeg_args(monkeypatch, volume=0.5, local=local)
+        assert "-af" in args
+        assert args[args.index("-c:a") + 1] == "libopus"
+
+
+def test_cached_opus_file_is_only_remuxed(monkeypatch):
+    args = ffmpeg_args(monkeypatch, clip_mode="fixed", local=True)
+    assert args[args.index("-c:a") + 1] == "copy"
+    assert "-af" not in args
+    assert "-ss" in args and "-t" in args